@@ -8,6 +8,12 @@ import shutil
 import sys
 import yaml
 from pathlib import Path
+from typing import Dict, Optional
+
+# metrics.py / generations.py лежат в scripts/ (в контейнере — рядом, в /app/bin)
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+import generations
+from metrics import PREFIX, JobMetrics
 
 # ============================================
 # Парсер аргументов
@@ -55,23 +61,85 @@ def set_owner(path: Path, owner: str, dry: bool):
     except Exception as e:
         print(f"[warn] chown {owner} failed for {path}: {e}")
 
-def copy_file(src: Path, dst: Path, owner: str, dry: bool):
+def tree_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+# ============================================
+# Рабочие пути поколений (generations.py)
+# ============================================
+def live_name(path: Path) -> Optional[str]:
+    """
+    Имя в поколении, если path — рабочий путь, уже ставший симлинком на
+    неизменяемое поколение. Писать через такой симлинк нельзя: файл только
+    для чтения, а под root запись испортила бы поколение.
+    """
+    p = os.path.abspath(path)
+    for name, live in generations.LIVE_PATHS.items():
+        if os.path.abspath(live) == p and os.path.islink(live):
+            return name
+    return None
+
+def live_ancestor(path: Path) -> Optional[str]:
+    """Имя каталога поколения (maps), если path лежит где-то внутри него."""
+    for parent in Path(os.path.abspath(path)).parents:
+        name = live_name(parent)
+        if name:
+            return name
+    return None
+
+def _pending_dir(name: str, pending: Dict[str, generations.FileData]) -> dict:
+    if name not in pending:
+        pending[name] = dict(generations.snapshot_live({name: generations.LIVE_PATHS[name]}).get(name) or {})
+    return pending[name]
+
+def stage_file(src: Path, dst: Path, pending: Dict[str, generations.FileData], dry: bool) -> Optional[int]:
+    """Копия на рабочий путь поколения -> в pending (None, если dst обычный путь)."""
+    name = live_name(dst)
+    if name and os.path.isdir(generations.LIVE_PATHS[name]):
+        dst, name = dst / src.name, None
+    parent = live_name(dst.parent)
+    if not name and not parent:
+        if live_ancestor(dst):
+            print(f"[warn] {dst}: вложенные каталоги в поколении не поддерживаются — пропускаю")
+            return 0
+        return None
+    print(f"[gen ] {src} -> {dst} (в новое поколение)")
+    if dry:
+        return 0
+    data = src.read_bytes()
+    if name:
+        pending[name] = data
+    else:
+        _pending_dir(parent, pending)[dst.name] = data
+    return len(data)
+
+def copy_file(src: Path, dst: Path, owner: str, dry: bool,
+              pending: Dict[str, generations.FileData]) -> int:
+    staged = stage_file(src, dst, pending, dry)
+    if staged is not None:
+        return staged
     print(f"[copy] {src} -> {dst}")
     if dry:
-        return
+        return 0
     ensure_dir(dst.parent, dry)
     shutil.copy2(src, dst)  # сохраняем время и права
     os.chmod(dst, src.stat().st_mode)
     set_owner(dst, owner, dry)
-
-def apply_rule(rule: dict, payload_root: Path, dest_root: Path, dry: bool):
+    return dst.stat().st_size
+
+def apply_rule(rule: dict, payload_root: Path, dest_root: Path, dry: bool,
+               pending: Dict[str, generations.FileData]) -> int:
+    """
+    Применяет одно правило; возвращает число записанных байт.
+    Файлы для рабочих путей поколений копятся в pending.
+    """
     src_pat = rule.get("from")
     to = rule.get("to")
     owner = rule.get("owner", "")
 
     if not src_pat or not to:
         print(f"[warn] invalid rule (need 'from' and 'to'): {rule}")
-        return
+        return 0
 
     to_path = dest_root / to.lstrip("/")
 
@@ -79,20 +147,38 @@ def apply_rule(rule: dict, payload_root: Path, dest_root: Path, dry: bool):
     matches = sorted(glob.glob(str((payload_root / src_pat).resolve()), recursive=True))
     if not matches:
         print(f"[warn] no matches for: {src_pat}")
-        return
+        return 0
 
     to_is_dir_hint = str(to).endswith("/") or (to_path.exists() and to_path.is_dir())
     multiple_sources = len(matches) > 1
+    written = 0
 
     for m in matches:
         s = Path(m)
         if s.is_dir():
             target_dir = to_path / s.name if to_is_dir_hint else to_path
+            if live_name(to_path) and not str(to).endswith("/"):
+                target_dir = to_path  # правило называет сам каталог поколения (maps)
+            name = live_name(target_dir)
+            if not name and live_ancestor(target_dir):
+                print(f"[warn] {target_dir}: вложенные каталоги в поколении не поддерживаются — пропускаю")
+                continue
+            if name:
+                # Каталоги в поколении плоские (maps) — берём только файлы верхнего уровня
+                print(f"[gen ] {s} -> {target_dir} (в новое поколение)")
+                if not dry:
+                    files = _pending_dir(name, pending)
+                    for f in sorted(s.iterdir()):
+                        if f.is_file():
+                            files[f.name] = f.read_bytes()
+                            written += f.stat().st_size
+                continue
             print(f"[dir ] {s} -> {target_dir}")
             if not dry:
                 ensure_dir(target_dir, dry)
                 shutil.copytree(s, target_dir, dirs_exist_ok=True)
                 set_owner(target_dir, owner, dry)
+                written += tree_size(s)
             continue
 
         if to_is_dir_hint or multiple_sources:
@@ -100,7 +186,9 @@ def apply_rule(rule: dict, payload_root: Path, dest_root: Path, dry: bool):
         else:
             dst = to_path
 
-        copy_file(s, dst, owner, dry)
+        written += copy_file(s, dst, owner, dry, pending)
+
+    return written
 
 # ============================================
 # Основная функция
@@ -125,8 +213,21 @@ def main():
         sys.exit(2)
 
     print(f"[info] payload={payload_root} map={map_file} root={dest_root} dry={args.dry}")
-    for r in rules:
-        apply_rule(r, payload_root, dest_root, args.dry)
+    metrics = JobMetrics("copy_files")
+    written = 0
+    pending: Dict[str, generations.FileData] = {}
+    try:
+        with metrics.step("copy_files"):
+            for r in rules:
+                written += apply_rule(r, payload_root, dest_root, args.dry, pending)
+            if pending and not args.dry:
+                gen = generations.commit_and_activate(pending, source="copy_files")
+                print(f"[gen ] {', '.join(sorted(pending))} -> generation {gen}")
+    finally:
+        metrics.bytes_written(written, "copy_files")
+        metrics.set(f"{PREFIX}_copy_rules", len(rules), "Rules in map.yml applied by copy_files.py")
+        if not args.dry:
+            metrics.flush()
 
     print("[done]")
 
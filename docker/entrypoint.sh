@@ -81,6 +81,12 @@ if [[ -x "$APP_ROOT/bin/11_apply_haproxy_changes.py" ]]; then
   }
 fi
 
+if [[ -f "$APP_ROOT/bin/validate_configs.py" ]]; then
+  python3 "$APP_ROOT/bin/validate_configs.py" cross || {
+    echo "[warn] server.json / haproxy.cfg cross-check reported errors (see above). Continuing..."
+  }
+fi
+
 # ---- 5) TLS (в K8s монтируем Secret в /app/tls) ------------------------------
 if [[ -x "$APP_ROOT/bin/06_install_certbot_renew.sh" ]]; then
   "$APP_ROOT/bin/06_install_certbot_renew.sh" || {
@@ -114,6 +120,9 @@ else
   if [[ -x "$APP_ROOT/bin/08_deploy_haproxy_etc.sh" ]]; then
     RUN_MODE=watch "$APP_ROOT/bin/08_deploy_haproxy_etc.sh" &
   fi
+  if [[ -f "$APP_ROOT/bin/healthcheck.py" ]]; then
+    python3 "$APP_ROOT/bin/healthcheck.py" serve --listen "${HEALTH_LISTEN:-127.0.0.1:8081}" &
+  fi
 
   tail -f "$APP_DATA/logs/"*.log /dev/null 2>/dev/null || sleep infinity
 fi
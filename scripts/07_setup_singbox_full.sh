@@ -48,14 +48,35 @@ fi
 
 mkdir -p "$RUN_DIR" "$LOG_DIR"
 
+METRICS_PY="${METRICS_PY:-$APP_ROOT/bin/metrics.py}"
+
+# Метрики reload (no-op, если metrics.py нет). Аргументы: <ok|fail> <start_ts>
+record_reload() {
+  [[ -f "$METRICS_PY" ]] || return 0
+  local secs
+  secs="$(awk -v a="$2" -v b="$(date +%s.%N)" 'BEGIN { printf "%.3f", b - a }')"
+  python3 "$METRICS_PY" reload singbox "$1" "$secs" >/dev/null 2>&1 || true
+}
+
+VALIDATE_PY="${VALIDATE_PY:-$APP_ROOT/bin/validate_configs.py}"
+
+# Проверка конфига: кросс-валидация + кэш по хэшу (fallback — прямой вызов)
+config_check() {
+  if [[ -f "$VALIDATE_PY" ]]; then
+    python3 "$VALIDATE_PY" check singbox --config "$SINGBOX_CONFIG" --bin "$SINGBOX_BIN"
+  else
+    "$SINGBOX_BIN" check -c "$SINGBOX_CONFIG"
+  fi
+}
+
 if [[ -n "${APP_OWNER:-}" ]]; then
   user=$(echo "$APP_OWNER" | cut -d':' -f1)
   group=$(echo "$APP_OWNER" | cut -d':' -f2)
   chown -R "$user":"$group" "$APP_DATA" || echo "[warn] chown $APP_OWNER failed (non-critical)"
 fi
 
-echo "[run ] $SINGBOX_BIN check -c $SINGBOX_CONFIG"
-if ! "$SINGBOX_BIN" check -c "$SINGBOX_CONFIG"; then
+echo "[run ] config_check $SINGBOX_CONFIG"
+if ! config_check; then
   echo "[err ] sing-box config validation failed." >&2
   exit 2
 fi
@@ -118,18 +139,33 @@ run_watch_loop() {
 
   if command -v inotifywait >/dev/null 2>&1; then
     echo "[ok  ] using inotifywait to watch $SINGBOX_CONFIG"
-    # следим за изменениями файла (modify, move, create)
+    # следим за изменениями файла (modify, move, create) в его каталоге, но
+    # реагируем только на сам файл: соседние haproxy.cfg и *.tmp.<pid>-ссылки
+    # generations.py (HAP_CFG=/app/config/haproxy.cfg в compose) не должны
+    # перезапускать sing-box. -m не теряет MOVED_TO сразу после MOVED_FROM.
+    local cfg_name changed
+    cfg_name="$(basename "$SINGBOX_CONFIG")"
     while true; do
-      inotifywait -e modify,move,create,close_write "$(dirname "$SINGBOX_CONFIG")" >/dev/null 2>&1 || true
-      # проверим валидность обновлённого конфига
-      echo "[info] change detected, validating new config..."
-      if "$SINGBOX_BIN" check -c "$SINGBOX_CONFIG"; then
-        echo "[info] config valid, reloading..."
-        stop_bg
-        start_bg
-      else
-        echo "[err ] new config invalid, skip reload (keeping old process)"
-      fi
+      while read -r changed; do
+        [[ "$changed" == "$cfg_name" ]] || continue
+        # схлопываем пачку событий одной записи (modify + close_write, move)
+        while read -r -t 1 changed; do :; done
+        # проверим валидность обновлённого конфига
+        echo "[info] change detected, validating new config..."
+        local started
+        started="$(date +%s.%N)"
+        if config_check; then
+          echo "[info] config valid, reloading..."
+          stop_bg
+          start_bg
+          record_reload ok "$started"
+        else
+          echo "[err ] new config invalid, skip reload (keeping old process)"
+          record_reload fail "$started"
+        fi
+      done < <(inotifywait -m -q -e modify,move,create,close_write --format '%f' "$(dirname "$SINGBOX_CONFIG")" 2>/dev/null)
+      echo "[warn] inotifywait exited, re-arming watch"
+      sleep 1
     done
   else
     echo "[warn] inotifywait not found; using checksum polling"
@@ -141,5 +177,5 @@ run_watch_loop() {
       cur_sum="$(sha256sum "$SINGBOX_CONFIG" | awk '{print $1}')"
       if [[ "$cur_sum" != "$last_sum" ]]; then
         echo "[info] config checksum changed, validating..."
-        if "$SINGBOX_BIN" check -c "$SINGBOX_CONFIG"; then
+        if config_check; then
           echo "[info] config
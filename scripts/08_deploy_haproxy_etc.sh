@@ -48,6 +48,27 @@ fi
 
 mkdir -p "$RUN_DIR" "$LOG_DIR" "$(dirname "$HAP_CFG")"
 
+METRICS_PY="${METRICS_PY:-$APP_ROOT/bin/metrics.py}"
+
+# Метрики reload (no-op, если metrics.py нет). Аргументы: <ok|fail> <start_ts>
+record_reload() {
+  [[ -f "$METRICS_PY" ]] || return 0
+  local secs
+  secs="$(awk -v a="$2" -v b="$(date +%s.%N)" 'BEGIN { printf "%.3f", b - a }')"
+  python3 "$METRICS_PY" reload haproxy "$1" "$secs" >/dev/null 2>&1 || true
+}
+
+VALIDATE_PY="${VALIDATE_PY:-$APP_ROOT/bin/validate_configs.py}"
+
+# Проверка конфига: кросс-валидация + кэш по хэшу (fallback — прямой вызов)
+config_check() {
+  if [[ -f "$VALIDATE_PY" ]]; then
+    python3 "$VALIDATE_PY" check haproxy --config "$HAP_CFG" --bin "$HAP_BIN"
+  else
+    "$HAP_BIN" -c -f "$HAP_CFG"
+  fi
+}
+
 # Владелец (опционально)
 if [[ -n "${APP_OWNER:-}" ]]; then
   user=$(echo "$APP_OWNER" | cut -d':' -f1)
@@ -56,8 +77,8 @@ if [[ -n "${APP_OWNER:-}" ]]; then
 fi
 
 # Валидация конфига
-echo "[run ] $HAP_BIN -c -f $HAP_CFG"
-"$HAP_BIN" -c -f "$HAP_CFG"
+echo "[run ] config_check $HAP_CFG"
+config_check
 
 # --- helpers ------------------------------------------------------------------
 get_pid() { [[ -f "$PID_FILE" ]] && cat "$PID_FILE" 2>/dev/null || true; }
@@ -86,13 +107,15 @@ reload_hot() {
   # Аккуратный hot-reload:
   #   - проверяем новый конфиг
   #   - запускаем новый master с -sf <oldpid>
-  local oldpid
+  local oldpid started
+  started="$(date +%s.%N)"
   oldpid="$(get_pid)"
   echo "[info] hot-reload request (oldpid=${oldpid:-none})"
 
-  echo "[check] $HAP_BIN -c -f $HAP_CFG"
-  if ! "$HAP_BIN" -c -f "$HAP_CFG"; then
+  echo "[check] config_check $HAP_CFG"
+  if ! config_check; then
     echo "[err ] new config invalid; abort reload."
+    record_reload fail "$started"
     return 2
   fi
 
@@ -108,9 +131,11 @@ reload_hot() {
   sleep "$RELOAD_GRACE"
   if ! is_running; then
     echo "[err ] haproxy reload failed (no running pid)." >&2
+    record_reload fail "$started"
     return 2
   fi
   echo "[ok  ] hot-reload completed (pid=$(get_pid))"
+  record_reload ok "$started"
 }
 
 watch_loop() {
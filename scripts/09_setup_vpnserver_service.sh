@@ -11,6 +11,8 @@ SUPERVISOR_CONF="${SUPERVISOR_CONF:-$APP_CFG/supervisord.conf}"
 
 SINGBOX_SCRIPT="$APP_ROOT/bin/07_setup_singbox_full.sh"
 HAPROXY_SCRIPT="$APP_ROOT/bin/08_deploy_haproxy_etc.sh"
+HEALTH_SCRIPT="$APP_ROOT/bin/healthcheck.py"
+HEALTH_LISTEN="${HEALTH_LISTEN:-127.0.0.1:8081}"
 
 mkdir -p "$RUN_DIR" "$LOG_DIR" "$APP_CFG"
 
@@ -61,6 +63,34 @@ stderr_logfile=$LOG_DIR/haproxy.supervisor.err.log
 startsecs=2
 stopwaitsecs=10
 environment=APP_ROOT="$APP_ROOT",APP_CFG="$APP_CFG",APP_DATA="$APP_DATA",RUN_DIR="$RUN_DIR",LOG_DIR="$LOG_DIR",RUN_MODE="watch",HAPROXY_SCRIPT="$HAPROXY_SCRIPT"
+
+; health/readiness (/livez, /readyz)
+[program:health]
+command=python3 $HEALTH_SCRIPT serve --listen $HEALTH_LISTEN
+autostart=true
+autorestart=true
+stopsignal=TERM
+stdout_logfile=$LOG_DIR/health.supervisor.out.log
+stderr_logfile=$LOG_DIR/health.supervisor.err.log
+startsecs=2
+stopwaitsecs=5
+environment=APP_ROOT="$APP_ROOT",APP_CFG="$APP_CFG",APP_DATA="$APP_DATA"
 EOF
 
 echo "[ok ] created: $SUPERVISOR_CONF"
+
+# Prometheus endpoint (опционально): METRICS_LISTEN=host:port
+if [[ -n "${METRICS_LISTEN:-}" ]]; then
+  cat >>"$SUPERVISOR_CONF" <<EOF2
+
+; metrics (Prometheus /metrics из $APP_DATA/metrics)
+[program:metrics]
+command=python3 $APP_ROOT/bin/metrics.py serve --listen $METRICS_LISTEN
+autostart=true
+autorestart=true
+stdout_logfile=$LOG_DIR/metrics.supervisor.out.log
+stderr_logfile=$LOG_DIR/metrics.supervisor.err.log
+environment=APP_ROOT="$APP_ROOT",APP_DATA="$APP_DATA"
+EOF2
+  echo "[ok ] metrics endpoint enabled: http://$METRICS_LISTEN/metrics"
+fi
@@ -7,9 +7,16 @@ import base64
 import secrets
 import string
 import sqlite3
+import time
 from random import randint
 from nacl.public import PrivateKey
 
+import generations
+from haproxy_changes import apply_haproxy_changes
+from metrics import PREFIX, ROTATION_METRIC, JobMetrics
+
+metrics = JobMetrics("mutate_server_json")
+
 # =========================
 # Контейнерные пути / ENV
 # =========================
@@ -17,6 +24,9 @@ APP_ROOT = os.getenv("APP_ROOT", "/app")
 APP_DATA = os.getenv("APP_DATA", os.path.join(APP_ROOT, "data"))
 APP_CFG  = os.getenv("APP_CFG",  os.path.join(APP_ROOT, "config"))
 SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(APP_DATA, "bd", "bd.db"))
+# Рабочие пути те же, что и в поколениях (SINGBOX_CONFIG / HAP_CFG)
+SERVER_PATH = generations.LIVE_PATHS["server.json"]
+HAP_PATH = generations.LIVE_PATHS["haproxy.cfg"]
 
 # Гарантируем наличие директорий
 os.makedirs(os.path.dirname(SQLITE_PATH), exist_ok=True)
@@ -43,236 +53,273 @@ def generate_reality_keypair():
     pub  = b64url_nopad(bytes(pk))
     return priv, pub
 
-# =========================
-# Подготовка БД (SQLite)
-# =========================
-conn = sqlite3.connect(SQLITE_PATH, timeout=30, check_same_thread=False)
-cur = conn.cursor()
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS fakedomain (
-    reality   TEXT,
-    shadowtls TEXT,
-    hysteria  TEXT
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS protocol_path (
-    v10_trojan_grpc TEXT NOT NULL,
-    v10_vless_grpc TEXT NOT NULL,
-    v10_vmess_grpc TEXT NOT NULL,
-    v10_vless_httpupgrade TEXT NOT NULL,
-    v10_vless_tcp TEXT NOT NULL,
-    v10_vmess_ws TEXT NOT NULL,
-    v10_vmess_tcp TEXT NOT NULL,
-    v10_vmess_httpupgrade TEXT NOT NULL,
-    hysteria_in_50062 TEXT NOT NULL,
-    realityin_43124 TEXT NOT NULL,
-    ss_new TEXT NOT NULL,
-    v10_trojan_tcp TEXT NOT NULL,
-    v10_trojan_ws TEXT NOT NULL,
-    v10_vless_ws TEXT NOT NULL
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS realitykey (
-    key TEXT
-)
-""")
-
-conn.commit()
-
-# =========================
-# Выбор доменов-маскарадеров
-# =========================
-masq_path = os.path.join(APP_CFG, "masq_domain_list.json")
-with open(masq_path, 'r', encoding='utf-8') as f:
-    masq_data = json.load(f)
-
-# Выбираем 3 уникальных домена из списка
-list_selected = []
-num = randint(0, len(masq_data))
-list_selected.append(masq_data[num - 1])
-num = randint(0, len(masq_data))
-while True:
-    if masq_data[num - 1] not in list_selected:
-        list_selected.append(masq_data[num - 1])
-        break
-    num = randint(0, len(masq_data))
-num = randint(0, len(masq_data))
-while True:
-    if masq_data[num - 1] not in list_selected:
+def ensure_generation_column(table: str):
+    cols = [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
+    if "generation" not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN generation INTEGER")
+
+try:
+    with metrics.step("mutate_server_json"):
+        # =========================
+        # Подготовка БД (SQLite)
+        # =========================
+        conn = sqlite3.connect(SQLITE_PATH, timeout=30, check_same_thread=False)
+        cur = conn.cursor()
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS fakedomain (
+            reality   TEXT,
+            shadowtls TEXT,
+            hysteria  TEXT
+        )
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS protocol_path (
+            v10_trojan_grpc TEXT NOT NULL,
+            v10_vless_grpc TEXT NOT NULL,
+            v10_vmess_grpc TEXT NOT NULL,
+            v10_vless_httpupgrade TEXT NOT NULL,
+            v10_vless_tcp TEXT NOT NULL,
+            v10_vmess_ws TEXT NOT NULL,
+            v10_vmess_tcp TEXT NOT NULL,
+            v10_vmess_httpupgrade TEXT NOT NULL,
+            hysteria_in_50062 TEXT NOT NULL,
+            realityin_43124 TEXT NOT NULL,
+            ss_new TEXT NOT NULL,
+            v10_trojan_tcp TEXT NOT NULL,
+            v10_trojan_ws TEXT NOT NULL,
+            v10_vless_ws TEXT NOT NULL
+        )
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS realitykey (
+            key TEXT
+        )
+        """)
+
+        # Секреты привязываются к поколению конфигурации (см. generations.py)
+        ensure_generation_column("protocol_path")
+        ensure_generation_column("realitykey")
+
+        conn.commit()
+
+        # =========================
+        # Выбор доменов-маскарадеров
+        # =========================
+        masq_path = os.path.join(APP_CFG, "masq_domain_list.json")
+        with open(masq_path, 'r', encoding='utf-8') as f:
+            masq_data = json.load(f)
+
+        # Выбираем 3 уникальных домена из списка
+        list_selected = []
+        num = randint(0, len(masq_data))
         list_selected.append(masq_data[num - 1])
-        break
-    num = randint(0, len(masq_data))
-
-# Сохраняем выбор для других скриптов
-vibork_path = os.path.join(APP_DATA, "msq_domain_list_vibork.json")
-with open(vibork_path, 'w', encoding='utf-8') as f:
-    json.dump(list_selected, f, ensure_ascii=False, indent=4)
-
-# Пишем в БД таблицу fakedomain
-cur.execute(
-    "INSERT INTO fakedomain (reality, shadowtls, hysteria) VALUES (?, ?, ?)",
-    (list_selected[0], list_selected[1], list_selected[2])
-)
-conn.commit()
-
-# =========================
-# Читаем основной домен сервера
-# (кладётся 04_setconfiguration.py)
-# =========================
-domain_txt_path = os.path.join(APP_DATA, "domain.txt")
-with open(domain_txt_path, 'r', encoding='utf-8') as f:
-    main_domain = f.read().strip()
-
-# =========================
-# Мутация server.json
-# =========================
-server_json_path = os.path.join(APP_CFG, "server.json")
-with open(server_json_path, mode="r+", encoding="utf-8") as f:
-    data = json.load(f)
-    mainBlock = data.get("inbounds", [])
-    changes_list = {}
-    changes_listwith = {}
-    publick = ""  # на случай отсутствия тега realityin_43124
-
-    for protocol in mainBlock:
-        tag = protocol.get("tag", "")
-
-        if tag == "v10-trojan-grpc":
-            transport = protocol.get("transport", {})
-            transport["service_name"] = f'api{generateString()}'
-            changes_list["v10-trojan-grpc"] = transport["service_name"]
-            changes_listwith["v10_trojan_grpc"] = transport["service_name"]
-
-        elif tag == "v10-vless-grpc":
-            transport = protocol.get("transport", {})
-            transport["service_name"] = f'api{generateString()}'
-            changes_list["v10-vless-grpc"] = transport["service_name"]
-            changes_listwith["v10_vless_grpc"] = transport["service_name"]
-
-        elif tag == "v10-vmess-grpc":
-            transport = protocol.get("transport", {})
-            transport["service_name"] = f'api{generateString()}'
-            changes_list["v10-vmess-grpc"] = transport["service_name"]
-            changes_listwith["v10_vmess_grpc"] = transport["service_name"]
-
-        elif tag == "v10-vless-httpupgrade":
-            transport = protocol.get("transport", {})
-            transport["path"] = f"/files{generateString()}"
-            changes_list["v10-vless-httpupgrade"] = transport["path"]
-            changes_listwith["v10_vless_httpupgrade"] = transport["path"]
-
-        elif tag == "v10-vless-tcp":
-            transport = protocol.get("transport", {})
-            transport["path"] = f"/user{generateString()}"
-            changes_list["v10-vless-tcp"] = transport["path"]
-            changes_listwith["v10_vless_tcp"] = transport["path"]
-
-        elif tag == "v10-vmess-ws":
-            transport = protocol.get("transport", {})
-            transport["path"] = f"/assets{generateString()}"
-            changes_list["v10-vmess-ws"] = transport["path"]
-            changes_listwith["v10_vmess_ws"] = transport["path"]
-
-        elif tag == "v10-vmess-tcp":
-            transport = protocol.get("transport", {})
-            transport["path"] = f"/user{generateString()}"
-            changes_list["v10-vmess-tcp"] = transport["path"]
-            changes_listwith["v10_vmess_tcp"] = transport["path"]
-
-        elif tag == "v10-vmess-httpupgrade":
-            transport = protocol.get("transport", {})
-            transport["path"] = f"/files{generateString()}"
-            changes_list["v10-vmess-httpupgrade"] = transport["path"]
-            changes_listwith["v10_vmess_httpupgrade"] = transport["path"]
-
-        elif tag == "hysteria_in_50062":
-            protocol["masquerade"] = f'https://{list_selected[2]}:80/'
-            obfs = protocol.get("obfs", {})
-            obfs["password"] = generateString()
-            protocol["obfs"] = obfs
-            changes_list["hysteria_in_50062"] = obfs["password"]
-            changes_listwith["hysteria_in_50062"] = obfs["password"]
-            tls = protocol.get("tls", {})
-            tls["server_name"] = main_domain
-            protocol["tls"] = tls
-
-        elif tag == "realityin_43124":
-            private, publick_val = generate_reality_keypair()
-            publick = str(publick_val)
-            tls = protocol.get("tls", {})
-            reality = tls.get("reality", {})
-            reality["private_key"] = private
-            tls["reality"] = reality
-            tls["server_name"] = list_selected[0]
-            handshake = reality.get("handshake", {})
-            handshake["server"] = list_selected[0]
-            reality["handshake"] = handshake
-            protocol["tls"] = tls
-            changes_list["realityin_43124"] = private
-            changes_listwith["realityin_43124"] = private
-
-        elif tag == "ss-new":
-            protocol["password"] = generate_ss2022_password()
-            changes_list["ss-new"] = protocol["password"]
-            changes_listwith["ss_new"] = protocol["password"]
-
-        elif tag == "shadowtls":
-            handshake = protocol.get("handshake", {})
-            handshake["server"] = list_selected[1]
-            protocol["handshake"] = handshake
-
-        elif tag == "v10-trojan-tcp":
-            transport = protocol.get("transport", {})
-            transport["path"] = f"/user{generateString()}"
-            changes_list["v10-trojan-tcp"] = transport["path"]
-            changes_listwith["v10_trojan_tcp"] = transport["path"]
-
-        elif tag == "v10-trojan-ws":
-            transport = protocol.get("transport", {})
-            transport["path"] = f"/assets{generateString()}"
-            changes_list["v10-trojan-ws"] = transport["path"]
-            changes_listwith["v10_trojan_ws"] = transport["path"]
-
-        elif tag == "v10-vless-ws":
-            transport = protocol.get("transport", {})
-            transport["path"] = f"/assets{generateString()}"
-            changes_list["v10-vless-ws"] = transport["path"]
-            changes_listwith["v10_vless_ws"] = transport["path"]
-
-        elif tag == "tuic_in_55851":
-            tls = protocol.get("tls", {})
-            tls["server_name"] = main_domain
-            protocol["tls"] = tls
-
-    # Записываем обновлённый server.json
-    f.seek(0)
-    json.dump(data, f, ensure_ascii=False, indent=4)
-    f.truncate()
-
-# =========================
-# Запись результатов мутации
-# =========================
-# Вставка путей в БД
-cols = ", ".join(changes_listwith.keys())
-placeholders = ", ".join("?" for _ in changes_listwith)
-values = tuple(changes_listwith.values())
-cur.execute(f"INSERT INTO protocol_path ({cols}) VALUES ({placeholders})", values)
-
-# Публичный ключ Reality (если есть)
-if publick:
-    cur.execute("INSERT INTO realitykey (key) VALUES (?)", (publick,))
-
-conn.commit()
-conn.close()
-
-# Файл с изменениями для других шагов
-changes_dict_path = os.path.join(APP_DATA, "changes_dict.json")
-with open(changes_dict_path, 'w', encoding="utf-8") as f:
-    json.dump(changes_list, f, ensure_ascii=False, indent=4)
-
-print("done")
+        num = randint(0, len(masq_data))
+        while True:
+            if masq_data[num - 1] not in list_selected:
+                list_selected.append(masq_data[num - 1])
+                break
+            num = randint(0, len(masq_data))
+        num = randint(0, len(masq_data))
+        while True:
+            if masq_data[num - 1] not in list_selected:
+                list_selected.append(masq_data[num - 1])
+                break
+            num = randint(0, len(masq_data))
+
+        # Сохраняем выбор для других скриптов
+        vibork_path = os.path.join(APP_DATA, "msq_domain_list_vibork.json")
+        with open(vibork_path, 'w', encoding='utf-8') as f:
+            json.dump(list_selected, f, ensure_ascii=False, indent=4)
+
+        # Пишем в БД таблицу fakedomain
+        cur.execute(
+            "INSERT INTO fakedomain (reality, shadowtls, hysteria) VALUES (?, ?, ?)",
+            (list_selected[0], list_selected[1], list_selected[2])
+        )
+        conn.commit()
+
+        # =========================
+        # Читаем основной домен сервера
+        # (кладётся 04_setconfiguration.py)
+        # =========================
+        domain_txt_path = os.path.join(APP_DATA, "domain.txt")
+        with open(domain_txt_path, 'r', encoding='utf-8') as f:
+            main_domain = f.read().strip()
+
+        # =========================
+        # Мутация server.json
+        # =========================
+        with open(SERVER_PATH, mode="r", encoding="utf-8") as f:
+            data = json.load(f)
+            mainBlock = data.get("inbounds", [])
+            changes_list = {}
+            changes_listwith = {}
+            publick = ""  # на случай отсутствия тега realityin_43124
+
+            for protocol in mainBlock:
+                tag = protocol.get("tag", "")
+
+                if tag == "v10-trojan-grpc":
+                    transport = protocol.get("transport", {})
+                    transport["service_name"] = f'api{generateString()}'
+                    changes_list["v10-trojan-grpc"] = transport["service_name"]
+                    changes_listwith["v10_trojan_grpc"] = transport["service_name"]
+
+                elif tag == "v10-vless-grpc":
+                    transport = protocol.get("transport", {})
+                    transport["service_name"] = f'api{generateString()}'
+                    changes_list["v10-vless-grpc"] = transport["service_name"]
+                    changes_listwith["v10_vless_grpc"] = transport["service_name"]
+
+                elif tag == "v10-vmess-grpc":
+                    transport = protocol.get("transport", {})
+                    transport["service_name"] = f'api{generateString()}'
+                    changes_list["v10-vmess-grpc"] = transport["service_name"]
+                    changes_listwith["v10_vmess_grpc"] = transport["service_name"]
+
+                elif tag == "v10-vless-httpupgrade":
+                    transport = protocol.get("transport", {})
+                    transport["path"] = f"/files{generateString()}"
+                    changes_list["v10-vless-httpupgrade"] = transport["path"]
+                    changes_listwith["v10_vless_httpupgrade"] = transport["path"]
+
+                elif tag == "v10-vless-tcp":
+                    transport = protocol.get("transport", {})
+                    transport["path"] = f"/user{generateString()}"
+                    changes_list["v10-vless-tcp"] = transport["path"]
+                    changes_listwith["v10_vless_tcp"] = transport["path"]
+
+                elif tag == "v10-vmess-ws":
+                    transport = protocol.get("transport", {})
+                    transport["path"] = f"/assets{generateString()}"
+                    changes_list["v10-vmess-ws"] = transport["path"]
+                    changes_listwith["v10_vmess_ws"] = transport["path"]
+
+                elif tag == "v10-vmess-tcp":
+                    transport = protocol.get("transport", {})
+                    transport["path"] = f"/user{generateString()}"
+                    changes_list["v10-vmess-tcp"] = transport["path"]
+                    changes_listwith["v10_vmess_tcp"] = transport["path"]
+
+                elif tag == "v10-vmess-httpupgrade":
+                    transport = protocol.get("transport", {})
+                    transport["path"] = f"/files{generateString()}"
+                    changes_list["v10-vmess-httpupgrade"] = transport["path"]
+                    changes_listwith["v10_vmess_httpupgrade"] = transport["path"]
+
+                elif tag == "hysteria_in_50062":
+                    protocol["masquerade"] = f'https://{list_selected[2]}:80/'
+                    obfs = protocol.get("obfs", {})
+                    obfs["password"] = generateString()
+                    protocol["obfs"] = obfs
+                    changes_list["hysteria_in_50062"] = obfs["password"]
+                    changes_listwith["hysteria_in_50062"] = obfs["password"]
+                    tls = protocol.get("tls", {})
+                    tls["server_name"] = main_domain
+                    protocol["tls"] = tls
+
+                elif tag == "realityin_43124":
+                    private, publick_val = generate_reality_keypair()
+                    publick = str(publick_val)
+                    tls = protocol.get("tls", {})
+                    reality = tls.get("reality", {})
+                    reality["private_key"] = private
+                    tls["reality"] = reality
+                    tls["server_name"] = list_selected[0]
+                    handshake = reality.get("handshake", {})
+                    handshake["server"] = list_selected[0]
+                    reality["handshake"] = handshake
+                    protocol["tls"] = tls
+                    changes_list["realityin_43124"] = private
+                    changes_listwith["realityin_43124"] = private
+
+                elif tag == "ss-new":
+                    protocol["password"] = generate_ss2022_password()
+                    changes_list["ss-new"] = protocol["password"]
+                    changes_listwith["ss_new"] = protocol["password"]
+
+                elif tag == "shadowtls":
+                    handshake = protocol.get("handshake", {})
+                    handshake["server"] = list_selected[1]
+                    protocol["handshake"] = handshake
+
+                elif tag == "v10-trojan-tcp":
+                    transport = protocol.get("transport", {})
+                    transport["path"] = f"/user{generateString()}"
+                    changes_list["v10-trojan-tcp"] = transport["path"]
+                    changes_listwith["v10_trojan_tcp"] = transport["path"]
+
+                elif tag == "v10-trojan-ws":
+                    transport = protocol.get("transport", {})
+                    transport["path"] = f"/assets{generateString()}"
+                    changes_list["v10-trojan-ws"] = transport["path"]
+                    changes_listwith["v10_trojan_ws"] = transport["path"]
+
+                elif tag == "v10-vless-ws":
+                    transport = protocol.get("transport", {})
+                    transport["path"] = f"/assets{generateString()}"
+                    changes_list["v10-vless-ws"] = transport["path"]
+                    changes_listwith["v10_vless_ws"] = transport["path"]
+
+                elif tag == "tuic_in_55851":
+                    tls = protocol.get("tls", {})
+                    tls["server_name"] = main_domain
+                    protocol["tls"] = tls
+
+        # =========================
+        # Новое поколение конфигурации
+        # =========================
+        # server.json, changes_dict.json (для других шагов) и haproxy.cfg с новыми
+        # путями/доменами попадают в одно неизменяемое поколение и активируются разом.
+        files = {
+            "server.json": json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8"),
+            "changes_dict.json": json.dumps(changes_list, ensure_ascii=False, indent=4).encode("utf-8"),
+        }
+        # Правка haproxy.cfg идёт здесь, поэтому заметки [PATH]/[HOST]/[MISS]
+        # печатаются и считаются этим шагом; шаг 11 затем видит [SKIP]
+        hap_notes = []
+        if os.path.exists(HAP_PATH):
+            hap_text, hap_notes = apply_haproxy_changes(
+                haproxy_path=HAP_PATH,
+                path_changes=changes_list,
+                reality_server_name=list_selected[0],
+                shadowtls_server_name=list_selected[1],
+                dry_run=True,
+            )
+            files["haproxy.cfg"] = hap_text.encode("utf-8")
+            print("\n".join(hap_notes))
+            metrics.count_notes(hap_notes)
+
+        generation = generations.commit_and_activate(files, source="10_mutate_server_json")
+        for name, blob in files.items():
+            metrics.bytes_written(len(blob), name)
+
+        # =========================
+        # Запись результатов мутации
+        # =========================
+        # Вставка путей в БД
+        changes_listwith["generation"] = generation
+        cols = ", ".join(changes_listwith.keys())
+        placeholders = ", ".join("?" for _ in changes_listwith)
+        values = tuple(changes_listwith.values())
+        cur.execute(f"INSERT INTO protocol_path ({cols}) VALUES ({placeholders})", values)
+
+        # Публичный ключ Reality (если есть)
+        if publick:
+            cur.execute("INSERT INTO realitykey (key, generation) VALUES (?, ?)", (publick, generation))
+
+        conn.commit()
+        conn.close()
+
+        # =========================
+        # Метрики
+        # =========================
+        metrics.set(ROTATION_METRIC, time.time(), "Unix time of the last secrets/paths rotation")
+        metrics.set(f"{PREFIX}_rotated_values", len(changes_list), "Values rotated by the last server.json mutation")
+finally:
+    metrics.flush()
+
+print(f"done (generation {generation})")
@@ -23,6 +23,27 @@ RELOAD_GRACE="${RELOAD_GRACE:-5}"   # секунды ожидания после
 
 mkdir -p "$RUN_DIR" "$LOG_DIR" "$(dirname "$HAP_CFG")"
 
+METRICS_PY="${METRICS_PY:-$APP_ROOT/bin/metrics.py}"
+
+# Метрики reload (no-op, если metrics.py нет). Аргументы: <ok|fail> <start_ts>
+record_reload() {
+  [[ -f "$METRICS_PY" ]] || return 0
+  local secs
+  secs="$(awk -v a="$2" -v b="$(date +%s.%N)" 'BEGIN { printf "%.3f", b - a }')"
+  python3 "$METRICS_PY" reload haproxy "$1" "$secs" >/dev/null 2>&1 || true
+}
+
+VALIDATE_PY="${VALIDATE_PY:-$APP_ROOT/bin/validate_configs.py}"
+
+# Проверка конфига: кросс-валидация + кэш по хэшу (fallback — прямой вызов)
+config_check() {
+  if [[ -f "$VALIDATE_PY" ]]; then
+    python3 "$VALIDATE_PY" check haproxy --config "$HAP_CFG" --bin "$HAP_BIN"
+  else
+    "$HAP_BIN" -c -f "$HAP_CFG"
+  fi
+}
+
 get_pid() { [[ -f "$PID_FILE" ]] && cat "$PID_FILE" 2>/dev/null || true; }
 is_running() { local p; p="$(get_pid)"; [[ -n "${p:-}" && -d "/proc/$p" ]]; }
 
@@ -54,8 +75,12 @@ if [[ ! -f "$HAP_CFG" ]]; then
   exit 2
 fi
 
-echo "[check] $HAP_BIN -c -f $HAP_CFG"
-"$HAP_BIN" -c -f "$HAP_CFG"
+reload_started="$(date +%s.%N)"
+echo "[check] config_check $HAP_CFG"
+if ! config_check; then
+  record_reload fail "$reload_started"
+  exit 1
+fi
 
 # --- Горячий перезапуск или старт --------------------------------------------
 oldpid="$(get_pid || true)"
@@ -67,9 +92,11 @@ if [[ -n "${oldpid:-}" && -d "/proc/$oldpid" ]]; then
   sleep "$RELOAD_GRACE"
   if ! is_running; then
     echo "[err ] reload failed: no running pid after grace." >&2
+    record_reload fail "$reload_started"
     exit 2
   fi
   echo "[ok  ] hot-reload completed (new pid=$(get_pid))"
+  record_reload ok "$reload_started"
 else
   echo "[info] no existing haproxy process, starting fresh"
   start_bg
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Версионированные поколения конфигурации (server.json, haproxy.cfg, maps,
+changes_dict.json).
+
+Каждая мутация создаёт неизменяемый каталог GEN_ROOT/gen-NNNNNN. Активация —
+атомарная подмена симлинка GEN_ROOT/current; рабочие пути (APP_CFG/server.json,
+HAP_CFG, ...) — симлинки на current/<file>, поэтому все файлы переключаются
+одним rename. Ссылки изменившихся файлов дополнительно пересоздаются, чтобы
+inotify-вотчеры 07/08 перезапускали только затронутый сервис. Откат просто
+перенаправляет current, ничего не генерируя.
+Старые поколения удаляются по LRU (GEN_KEEP последних использованных).
+
+CLI:
+    generations.py list | current
+    generations.py snapshot            — зафиксировать текущие рабочие файлы
+    generations.py activate <N>
+    generations.py rollback [N]        — по умолчанию предыдущее активное
+    generations.py prune [--keep K]
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import stat
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Union
+
+from metrics import PREFIX, JobMetrics
+
+# =========================================================
+# Контейнерные пути / ENV
+# =========================================================
+APP_ROOT = os.getenv("APP_ROOT", "/app")
+APP_CFG  = os.getenv("APP_CFG",  os.path.join(APP_ROOT, "config"))
+APP_DATA = os.getenv("APP_DATA", os.path.join(APP_ROOT, "data"))
+
+GEN_ROOT = os.getenv("GEN_ROOT", os.path.join(APP_DATA, "generations"))
+GEN_KEEP = int(os.getenv("GEN_KEEP", "10"))
+
+HAP_PATH = os.getenv("HAP_CFG", os.getenv("HAP_PATH", os.path.join(APP_CFG, "haproxy", "haproxy.cfg")))
+
+# Имя в поколении -> рабочий путь
+LIVE_PATHS: Dict[str, str] = {
+    "server.json": os.getenv("SINGBOX_CONFIG", os.path.join(APP_CFG, "server.json")),
+    "haproxy.cfg": HAP_PATH,
+    "maps": os.getenv("HAP_MAPS_DIR", os.path.join(APP_CFG, "haproxy", "maps")),
+    "changes_dict.json": os.getenv("CHANGES_PATH", os.path.join(APP_DATA, "changes_dict.json")),
+}
+
+CURRENT = "current"
+STATE_FILE = "state.json"
+
+FileData = Union[bytes, Dict[str, bytes]]  # файл или каталог (maps)
+
+# =========================================================
+# Вспомогательные функции
+# =========================================================
+def _gen_name(gen: int) -> str:
+    return f"gen-{gen:06d}"
+
+def _gen_dir(gen: int, root: str) -> str:
+    return os.path.join(root, _gen_name(gen))
+
+@contextmanager
+def _locked(root: str) -> Iterator[None]:
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def _load_state(root: str) -> dict:
+    try:
+        with open(os.path.join(root, STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"history": [], "used": {}}
+
+def _save_state(root: str, state: dict) -> None:
+    path = os.path.join(root, STATE_FILE)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _swap_symlink(link: str, target: str) -> None:
+    """Атомарно (rename) направляет link на target."""
+    tmp = f"{link}.tmp.{os.getpid()}"
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    os.symlink(target, tmp)
+    os.replace(tmp, link)
+
+def _read_live(path: str) -> Optional[FileData]:
+    if os.path.isdir(path):
+        out = {}
+        for name in sorted(os.listdir(path)):
+            p = os.path.join(path, name)
+            if os.path.isfile(p):
+                with open(p, "rb") as f:
+                    out[name] = f.read()
+        return out
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            return f.read()
+    return None
+
+def _make_writable(path: str) -> None:
+    for dirpath, dirnames, _ in os.walk(path):
+        os.chmod(dirpath, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+
+def _freeze(path: str) -> None:
+    ro_file = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+    ro_dir = ro_file | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            os.chmod(os.path.join(dirpath, name), ro_file)
+        os.chmod(dirpath, ro_dir)
+
+# =========================================================
+# Чтение
+# =========================================================
+def list_generations(root: str = GEN_ROOT) -> List[int]:
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return []
+    gens = []
+    for name in names:
+        if name.startswith("gen-") and name[4:].isdigit():
+            gens.append(int(name[4:]))
+    return sorted(gens)
+
+def current_generation(root: str = GEN_ROOT) -> Optional[int]:
+    try:
+        target = os.readlink(os.path.join(root, CURRENT))
+    except OSError:
+        return None
+    name = os.path.basename(target)
+    return int(name[4:]) if name.startswith("gen-") and name[4:].isdigit() else None
+
+def read_meta(gen: int, root: str = GEN_ROOT) -> dict:
+    with open(os.path.join(_gen_dir(gen, root), "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def snapshot_live(live_paths: Optional[Dict[str, str]] = None) -> Dict[str, FileData]:
+    """Текущее содержимое рабочих файлов (через симлинки — т.е. активное поколение)."""
+    files = {}
+    for name, path in (live_paths or LIVE_PATHS).items():
+        data = _read_live(path)
+        if data is not None:
+            files[name] = data
+    return files
+
+# =========================================================
+# Запись
+# =========================================================
+def commit(files: Dict[str, FileData], source: str = "", root: str = GEN_ROOT) -> int:
+    """
+    Создаёт новое неизменяемое поколение и возвращает его номер.
+    Каталог собирается во временном месте и появляется одним rename.
+    """
+    with _locked(root):
+        gen = (list_generations(root) or [0])[-1] + 1
+        tmp = os.path.join(root, f".{_gen_name(gen)}.tmp.{os.getpid()}")
+        os.makedirs(tmp)
+
+        for name, data in files.items():
+            path = os.path.join(tmp, name)
+            if isinstance(data, dict):
+                os.makedirs(path)
+                for sub, blob in data.items():
+                    with open(os.path.join(path, sub), "wb") as f:
+                        f.write(blob)
+            else:
+                with open(path, "wb") as f:
+                    f.write(data)
+
+        meta = {"generation": gen, "created": time.time(), "source": source, "files": sorted(files)}
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        _freeze(tmp)
+        os.rename(tmp, _gen_dir(gen, root))
+
+        state = _load_state(root)
+        state["used"][str(gen)] = time.time()
+        _save_state(root, state)
+    return gen
+
+def link_live(live_paths: Optional[Dict[str, str]] = None, root: str = GEN_ROOT,
+              prev: Optional[int] = None) -> List[str]:
+    """
+    Рабочие пути -> симлинки на current/<name>. Ссылка пересоздаётся (rename)
+    только если её ещё нет или содержимое отличается от поколения prev:
+    inotify-вотчер 07 на каталоге server.json иначе перезапускал бы sing-box
+    на каждое haproxy-only поколение. Реальный каталог (maps) при первом
+    переходе откладывается в *.pre-generations. Возвращает пересозданные имена.
+    """
+    current = os.path.join(root, CURRENT)
+    swapped = []
+    for name, live in (live_paths or LIVE_PATHS).items():
+        if not os.path.lexists(os.path.join(current, name)):
+            continue
+        target = os.path.join(os.path.abspath(current), name)
+        linked = os.path.islink(live) and os.readlink(live) == target
+        if linked and prev is not None and \
+                _read_live(os.path.join(_gen_dir(prev, root), name)) == _read_live(target):
+            continue
+        if os.path.isdir(live) and not os.path.islink(live):
+            os.rename(live, f"{live}.pre-generations")
+        os.makedirs(os.path.dirname(live), exist_ok=True)
+        _swap_symlink(live, target)
+        swapped.append(name)
+    return swapped
+
+def activate(gen: int, root: str = GEN_ROOT, live_paths: Optional[Dict[str, str]] = None,
+             kind: str = "activate") -> None:
+    if not os.path.isdir(_gen_dir(gen, root)):
+        raise ValueError(f"generation {gen} not found in {root}")
+
+    with _locked(root):
+        prev = current_generation(root)
+        _swap_symlink(os.path.join(root, CURRENT), _gen_name(gen))
+        link_live(live_paths, root, prev)
+
+        state = _load_state(root)
+        if kind == "rollback":
+            # Откат снимает со стека, а не кладёт на него: повторный rollback
+            # идёт дальше назад, а не обратно на покинутое поколение
+            if gen in state["history"]:
+                del state["history"][len(state["history"]) - 1 - state["history"][::-1].index(gen):]
+        elif prev is not None and prev != gen:
+            state["history"].append(prev)
+            state["history"] = state["history"][-100:]
+        state["used"][str(gen)] = time.time()
+        _save_state(root, state)
+
+    metrics = JobMetrics("generations")
+    metrics.set(f"{PREFIX}_generation_current", gen, "Active config generation")
+    metrics.inc(f"{PREFIX}_generation_activations_total", 1,
+                "Config generation activations by kind", kind=kind)
+    metrics.flush()
+
+def commit_and_activate(overrides: Dict[str, FileData], source: str = "",
+                        root: str = GEN_ROOT, live_paths: Optional[Dict[str, str]] = None) -> int:
+    """Новое поколение = активные файлы + overrides; сразу активируется и чистит старые."""
+    files = snapshot_live(live_paths)
+    files.update(overrides)
+    gen = commit(files, source, root)
+    activate(gen, root, live_paths, kind="commit")
+    prune(GEN_KEEP, root)
+    return gen
+
+def rollback(gen: Optional[int] = None, root: str = GEN_ROOT,
+             live_paths: Optional[Dict[str, str]] = None) -> int:
+    """Переключает current на gen (или на предыдущее активное поколение)."""
+    if gen is None:
+        cur = current_generation(root)
+        existing = set(list_generations(root))
+        candidates = [g for g in reversed(_load_state(root)["history"]) if g != cur and g in existing]
+        if not candidates:
+            raise ValueError("no previous generation to roll back to")
+        gen = candidates[0]
+    activate(gen, root, live_paths, kind="rollback")
+    return gen
+
+def prune(keep: int = GEN_KEEP, root: str = GEN_ROOT) -> List[int]:
+    """Удаляет наименее недавно использованные поколения сверх keep (current не трогаем)."""
+    removed = []
+    with _locked(root):
+        state = _load_state(root)
+        cur = current_generation(root)
+        gens = list_generations(root)
+        by_use = sorted(gens, key=lambda g: state["used"].get(str(g), 0.0), reverse=True)
+        for gen in by_use[max(keep, 1):]:
+            if gen == cur:
+                continue
+            path = _gen_dir(gen, root)
+            _make_writable(path)
+            shutil.rmtree(path)
+            state["used"].pop(str(gen), None)
+            removed.append(gen)
+        state["history"] = [g for g in state["history"] if g not in removed]
+        _save_state(root, state)
+    return removed
+
+# =========================================================
+# Точка входа
+# =========================================================
+def parse_args():
+    p = argparse.ArgumentParser(description="Versioned config generations")
+    p.add_argument("--root", default=GEN_ROOT, help="generation store (default %(default)s)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="list generations")
+    sub.add_parser("current", help="print active generation")
+    sub.add_parser("snapshot", help="commit live files as a new generation and activate it")
+    a = sub.add_parser("activate", help="activate generation N")
+    a.add_argument("gen", type=int)
+    r = sub.add_parser("rollback", help="activate previous (or given) generation")
+    r.add_argument("gen", type=int, nargs="?")
+    k = sub.add_parser("prune", help="drop least recently used generations")
+    k.add_argument("--keep", type=int, default=GEN_KEEP)
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    try:
+        if args.cmd == "list":
+            cur = current_generation(args.root)
+            for gen in list_generations(args.root):
+                meta = read_meta(gen, args.root)
+                mark = "*" if gen == cur else " "
+                created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta["created"]))
+                print(f"{mark} {gen:6d}  {created}  {meta.get('source', '')}")
+        elif args.cmd == "current":
+            print(current_generation(args.root) or "")
+        elif args.cmd == "snapshot":
+            gen = commit_and_activate({}, "snapshot", args.root)
+            print(f"[ok  ] generation {gen} activated")
+        elif args.cmd == "activate":
+            activate(args.gen, args.root)
+            print(f"[ok  ] generation {args.gen} activated")
+        elif args.cmd == "rollback":
+            gen = rollback(args.gen, args.root)
+            print(f"[ok  ] rolled back to generation {gen}")
+        elif args.cmd == "prune":
+            removed = prune(args.keep, args.root)
+            print(f"[ok  ] pruned: {removed or 'nothing'}")
+    except (OSError, ValueError) as e:
+        print(f"[err ] {e}", file=sys.stderr)
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
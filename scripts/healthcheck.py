@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Health/readiness сервис для sing-box + haproxy (asyncio, без зависимостей).
+
+Читает server.json и haproxy.cfg, параллельно проверяет все inbound'ы
+(TCP — connect, UDP — наличие сокета в /proc/net/udp*), локальные backend'ы
+и bind'ы haproxy. Результат кэшируется на HEALTH_INTERVAL секунд, так что
+запрос к эндпоинту стоит один дешёвый HTTP-запрос.
+
+    GET /livez   — 200, если haproxy принимает соединения на своих bind'ах
+                   (server.json не читается)
+    GET /readyz  — 200, если живы все inbound'ы (кроме HEALTH_OPTIONAL); иначе 503.
+                   В теле JSON с деталями по каждой цели, включая backend'ы.
+                   Нечитаемый конфиг — проваленная цель kind=config и поле error
+
+CLI:
+    healthcheck.py serve [--listen 127.0.0.1:8081]
+    healthcheck.py probe [--live]      — разовая проверка, код выхода 0/1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List, Optional, Set, Tuple
+
+from validate_configs import HAP_PATH, LOCAL_HOSTS, SERVER_PATH, inbound_protos, load_haproxy, load_server
+
+# =========================================================
+# Настройки / ENV
+# =========================================================
+HEALTH_LISTEN   = os.getenv("HEALTH_LISTEN", "127.0.0.1:8081")
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "10"))
+HEALTH_TIMEOUT  = float(os.getenv("HEALTH_TIMEOUT", "1.0"))
+# Теги inbound'ов, не влияющие на readiness (через запятую)
+HEALTH_OPTIONAL = {t.strip() for t in os.getenv("HEALTH_OPTIONAL", "").split(",") if t.strip()}
+
+PROC_UDP = ("/proc/net/udp", "/proc/net/udp6")
+
+# =========================================================
+# Цели проверки
+# =========================================================
+def _probe_host(listen: str) -> str:
+    return "127.0.0.1" if listen in ("", "0.0.0.0", "::", "localhost") else listen
+
+def build_targets(server_path: str, haproxy_path: Optional[str]) -> List[dict]:
+    """
+    Список целей: inbound'ы sing-box, локальные backend'ы и bind'ы haproxy.
+    Конфиг, который не удалось прочитать, становится проваленной целью kind=config.
+    server_path=None — только haproxy (для /livez).
+    """
+    targets = []
+    seen: Set[Tuple[str, str, int]] = set()
+
+    def load(loader, path: Optional[str], name: str) -> Optional[dict]:
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return loader(path)
+        except (OSError, ValueError) as e:
+            targets.append({"kind": "config", "name": name, "proto": "file", "host": path,
+                            "port": None, "required": True, "error": f"{type(e).__name__}: {e}"})
+            return None
+
+    def add(kind: str, name: str, proto: str, host: str, port: int, required: bool) -> None:
+        key = (proto, host, port)
+        if key in seen:
+            return
+        seen.add(key)
+        targets.append({"kind": kind, "name": name, "proto": proto,
+                        "host": host, "port": port, "required": required})
+
+    hap = load(load_haproxy, haproxy_path, "haproxy.cfg")
+    if hap:
+        for proto, port in hap["binds"]:
+            if proto == "tcp":
+                add("frontend", f"haproxy:{port}", proto, "127.0.0.1", port, True)
+
+    inbounds = load(load_server, server_path, "server.json")
+    if inbounds:
+        for tag, ib in inbounds.items():
+            if ib["port"] is None:
+                continue
+            for proto in inbound_protos(ib["type"]):
+                add("inbound", tag, proto, _probe_host(ib["listen"]), ib["port"],
+                    tag not in HEALTH_OPTIONAL)
+
+    if hap:
+        for be, servers in hap["backends"].items():
+            for host, port in servers:
+                if port is not None and host in LOCAL_HOSTS:
+                    add("backend", be, "tcp", _probe_host(host), port, False)
+    return targets
+
+# =========================================================
+# Пробы
+# =========================================================
+async def _probe_tcp(host: str, port: int, timeout: float) -> Tuple[bool, str]:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        return False, f"timeout after {timeout}s"
+    except OSError as e:
+        return False, e.strerror or str(e)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True, "connected"
+
+def _udp_ports() -> Set[int]:
+    ports = set()
+    for path in PROC_UDP:
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                next(f, None)
+                for line in f:
+                    local = line.split()[1]
+                    ports.add(int(local.rsplit(":", 1)[1], 16))
+        except (OSError, IndexError, ValueError):
+            continue
+    return ports
+
+async def _probe_one(t: dict, udp_ports: Set[int], timeout: float) -> dict:
+    started = time.monotonic()
+    if t["kind"] == "config":
+        ok, detail = False, t["error"]
+    elif t["proto"] == "udp":
+        ok = t["port"] in udp_ports
+        detail = "socket bound" if ok else "no udp socket on port"
+    else:
+        ok, detail = await _probe_tcp(t["host"], t["port"], timeout)
+    return {**t, "ok": ok, "detail": detail, "latency_ms": round((time.monotonic() - started) * 1000, 2)}
+
+def _is_live_target(r: dict) -> bool:
+    return r["kind"] == "frontend" or (r["kind"] == "config" and r["name"] == "haproxy.cfg")
+
+async def probe_all(server_path: Optional[str] = SERVER_PATH, haproxy_path: str = HAP_PATH,
+                    timeout: float = HEALTH_TIMEOUT) -> dict:
+    targets = build_targets(server_path, haproxy_path)
+    udp_ports = _udp_ports() if any(t["proto"] == "udp" for t in targets) else set()
+    results = await asyncio.gather(*(_probe_one(t, udp_ports, timeout) for t in targets))
+
+    live = all(r["ok"] for r in results if _is_live_target(r))
+    ready = live and all(r["ok"] for r in results if r["required"])
+    out = {"live": live, "ready": ready, "checked_at": time.time(), "targets": list(results)}
+    errors = [f"{r['name']}: {r['error']}" for r in results if r["kind"] == "config"]
+    if errors:
+        out["error"] = "; ".join(errors)
+    return out
+
+class ProbeCache:
+    """
+    Один результат на HEALTH_INTERVAL; параллельные запросы ждут одну пробу.
+    live=True — только bind'ы haproxy, server.json не читается.
+    """
+
+    def __init__(self, interval: float = HEALTH_INTERVAL, live: bool = False):
+        self.interval = interval
+        self.live = live
+        self._result: Optional[dict] = None
+        self._at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> dict:
+        async with self._lock:
+            if self._result is None or time.monotonic() - self._at >= self.interval:
+                self._result = await probe_all(None if self.live else SERVER_PATH)
+                self._at = time.monotonic()
+            return self._result
+
+# =========================================================
+# HTTP
+# =========================================================
+_STATUS = {200: "OK", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                  live_cache: ProbeCache, ready_cache: ProbeCache) -> None:
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 5)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        parts = request.decode("latin-1").split()
+        method, path = (parts[0], parts[1].split("?", 1)[0]) if len(parts) >= 2 else ("", "")
+
+        if method not in ("GET", "HEAD"):
+            status, body = 405, {"error": "method not allowed"}
+        elif path == "/livez":
+            result = await live_cache.get()
+            status = 200 if result["live"] else 503
+            body = {k: result[k] for k in ("live", "checked_at", "error") if k in result}
+        elif path == "/readyz":
+            result = await ready_cache.get()
+            status = 200 if result["ready"] else 503
+            body = result
+        else:
+            status, body = 404, {"error": "not found"}
+
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {_STATUS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n").encode("latin-1")
+        writer.write(head if method == "HEAD" else head + payload)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(listen: str) -> None:
+    host, _, port = listen.rpartition(":")
+    live_cache, ready_cache = ProbeCache(live=True), ProbeCache()
+    server = await asyncio.start_server(lambda r, w: _handle(r, w, live_cache, ready_cache),
+                                        host or "127.0.0.1", int(port))
+    print(f"[info] health endpoint on http://{listen}/livez, /readyz "
+          f"(interval={HEALTH_INTERVAL}s timeout={HEALTH_TIMEOUT}s)")
+    async with server:
+        await server.serve_forever()
+
+# =========================================================
+# Точка входа
+# =========================================================
+def parse_args():
+    p = argparse.ArgumentParser(description="Concurrent health/readiness probes for sing-box + haproxy")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="run the HTTP health endpoint")
+    s.add_argument("--listen", default=HEALTH_LISTEN, help="host:port (default %(default)s)")
+    o = sub.add_parser("probe", help="probe once and exit 0/1")
+    o.add_argument("--live", action="store_true", help="liveness only")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "serve":
+        asyncio.run(serve(args.listen))
+        return
+
+    result = asyncio.run(probe_all(None if args.live else SERVER_PATH))
+    for r in result["targets"]:
+        mark = "ok  " if r["ok"] else ("FAIL" if r["required"] else "warn")
+        where = r["host"] if r["kind"] == "config" else f"{r['proto']}/{r['host']}:{r['port']}"
+        print(f"[{mark}] {r['kind']:8} {r['name']:32} {where}  {r['detail']}")
+    sys.exit(0 if result["live" if args.live else "ready"] else 1)
+
+if __name__ == "__main__":
+    main()
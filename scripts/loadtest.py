@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный нагрузочный стенд для маршрутов HAProxy -> sing-box.
+
+Из server.json, changes_dict.json и haproxy.cfg берутся текущие пути
+и service_name; на listen_port'ах inbound'ов поднимаются эхо-заглушки
+(ws / httpupgrade / http / h2), а из боевого haproxy.cfg собирается
+стендовый конфиг: те же global/defaults, backend'ы и правила path_beg
+фронтендов in-tcpmode (HTTP/1.1) и in-httpmode (h2c). Через haproxy
+(HAP_BIN, как в 08/12) гоняется параллельный трафик, на выходе — пропускная
+способность и p50/p99 задержки по каждому пути.
+
+h2/gRPC-маршруты требуют python3-h2; без него они пропускаются.
+
+CLI:
+    loadtest.py [--concurrency 16] [--messages 200] [--size 4096]
+                [--only SUBSTR] [--direct] [--json PATH] [--keep-cfg]
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from haproxy_changes import TAG_TO_BACKENDS
+from validate_configs import HAP_BIN, HAP_PATH, SERVER_PATH, load_haproxy, load_server
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:  # python3-h2 не установлен — h2-маршруты пропускаются
+    h2 = None
+
+# =========================================================
+# Контейнерные пути / ENV
+# =========================================================
+APP_ROOT = os.getenv("APP_ROOT", "/app")
+APP_DATA = os.getenv("APP_DATA", os.path.join(APP_ROOT, "data"))
+
+CHANGES_PATH = os.getenv("CHANGES_PATH", os.path.join(APP_DATA, "changes_dict.json"))
+
+TCP_FRONTEND = "in-tcpmode"
+HTTP_FRONTEND = "in-httpmode"
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+H2_MAX_BODY = 16384  # одно DATA-окно без ожидания WINDOW_UPDATE
+
+_SECTION_RX = re.compile(r"^(global|defaults|frontend|backend|listen)\b\s*(\S+)?")
+_SERVER_ADDR_RX = re.compile(r"^(\s*server\s+\S+\s+)(\S+):(\d+)")
+
+# =========================================================
+# Маршруты
+# =========================================================
+def discover_routes(server_path: str, haproxy_path: str, changes_path: str) -> List[dict]:
+    """Маршруты path_beg из in-tcpmode (h1) и in-httpmode (h2) к inbound'ам sing-box."""
+    inbounds = load_server(server_path)
+    hap = load_haproxy(haproxy_path)
+    changes: Dict[str, str] = {}
+    if os.path.exists(changes_path):
+        with open(changes_path, "r", encoding="utf-8") as f:
+            changes = json.load(f)
+
+    be_to_tag = {be: tag for tag, bes in TAG_TO_BACKENDS.items() for be in bes}
+    routes, seen = [], set()
+    for r in hap["rules"]:
+        if r["kind"] != "path_beg" or r["frontend"] not in (TCP_FRONTEND, HTTP_FRONTEND):
+            continue
+        tag = be_to_tag.get(r["backend"])
+        ib = inbounds.get(tag)
+        if ib is None or (r["frontend"], r["backend"]) in seen:
+            continue
+        seen.add((r["frontend"], r["backend"]))
+
+        proto = "h2" if r["frontend"] == HTTP_FRONTEND else "h1"
+        if proto == "h1" and ib["transport"] == "grpc":
+            continue  # gRPC в боевой схеме уходит в in-httpmode по ALPN h2
+
+        rotated = changes.get(tag)
+        if rotated and "/" + rotated.lstrip("/") != ib["path"]:
+            print(f"[warn] {tag}: changes_dict.json ({rotated}) != server.json ({ib['path']})")
+        if ib["path"] and r["value"] != ib["path"]:
+            print(f"[warn] {r['backend']}: path_beg {r['value']} != server.json {ib['path']} (expect errors)")
+
+        routes.append({
+            "name": f"{r['frontend']}/{r['backend']}",
+            "frontend": r["frontend"],
+            "backend": r["backend"],
+            "tag": tag,
+            "transport": ib["transport"],
+            "proto": proto,
+            "path_beg": r["value"],
+            "path": r["value"] + ("/Tun" if ib["transport"] == "grpc" else ""),
+            "expected": ib["path"] or "/",
+            "port": ib["port"],
+        })
+    return routes
+
+# =========================================================
+# Стендовый haproxy.cfg
+# =========================================================
+def _sections(text: str) -> Dict[Tuple[str, Optional[str]], List[str]]:
+    out: Dict[Tuple[str, Optional[str]], List[str]] = {}
+    key = None
+    for raw in text.splitlines():
+        m = _SECTION_RX.match(raw.strip())
+        if m and not raw.startswith((" ", "\t")):
+            key = (m.group(1), m.group(2))
+            out[key] = []
+            continue
+        if key:
+            out[key].append(raw)
+    return out
+
+def build_harness_cfg(haproxy_path: str, routes: List[dict], tcp_port: int, h2_port: int,
+                      port_offset: int) -> str:
+    with open(haproxy_path, "r", encoding="utf-8") as f:
+        sections = _sections(f.read())
+
+    lines = []
+    for kind in ("global", "defaults"):
+        lines.append(kind)
+        lines += sections.get((kind, None), [])
+
+    lines += [
+        f"frontend {TCP_FRONTEND}",
+        f"    bind 127.0.0.1:{tcp_port}",
+        "    tcp-request inspect-delay 5s",
+        "    tcp-request content accept if HTTP",
+    ]
+    lines += [f"    use_backend {r['backend']} if {{ path_beg {r['path_beg']} }}"
+              for r in routes if r["frontend"] == TCP_FRONTEND]
+    lines += ["    default_backend lt_reject", ""]
+
+    lines += [
+        f"frontend {HTTP_FRONTEND}",
+        f"    bind 127.0.0.1:{h2_port} proto h2",
+        "    mode http",
+    ]
+    lines += [f"    use_backend {r['backend']} if {{ path_beg {r['path_beg']} }}"
+              for r in routes if r["frontend"] == HTTP_FRONTEND]
+    lines += ["    default_backend lt_reject_http", ""]
+
+    def _server(m: re.Match) -> str:
+        return f"{m.group(1)}127.0.0.1:{int(m.group(3)) + port_offset}"
+
+    for backend in sorted({r["backend"] for r in routes}):
+        lines.append(f"backend {backend}")
+        lines += [_SERVER_ADDR_RX.sub(_server, raw) for raw in sections.get(("backend", backend), [])]
+
+    lines += [
+        "backend lt_reject",
+        "",
+        "backend lt_reject_http",
+        "    mode http",
+        "    http-request return status 404",
+        "",
+    ]
+    return "\n".join(lines)
+
+# =========================================================
+# WebSocket / HTTP helpers
+# =========================================================
+def _mask(data: bytes, key: bytes) -> bytes:
+    if not data:
+        return data
+    k = (key * (len(data) // 4 + 1))[:len(data)]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(k, "big")).to_bytes(len(data), "big")
+
+def ws_frame(payload: bytes, opcode: int = 0x2, mask: bool = False) -> bytes:
+    head = bytearray([0x80 | opcode])
+    mbit = 0x80 if mask else 0
+    n = len(payload)
+    if n < 126:
+        head.append(mbit | n)
+    elif n < 65536:
+        head.append(mbit | 126)
+        head += n.to_bytes(2, "big")
+    else:
+        head.append(mbit | 127)
+        head += n.to_bytes(8, "big")
+    if mask:
+        key = os.urandom(4)
+        head += key
+        payload = _mask(payload, key)
+    return bytes(head) + payload
+
+async def ws_read(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    b1, b2 = await reader.readexactly(2)
+    n = b2 & 0x7F
+    if n == 126:
+        n = int.from_bytes(await reader.readexactly(2), "big")
+    elif n == 127:
+        n = int.from_bytes(await reader.readexactly(8), "big")
+    key = await reader.readexactly(4) if b2 & 0x80 else None
+    data = await reader.readexactly(n)
+    return b1 & 0x0F, _mask(data, key) if key else data
+
+def ws_accept(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+
+async def read_head(reader: asyncio.StreamReader) -> Tuple[str, Dict[str, str]]:
+    raw = await reader.readuntil(b"\r\n\r\n")
+    lines = raw.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+# =========================================================
+# Эхо-заглушки inbound'ов
+# =========================================================
+class EchoBackend:
+    """Заглушка inbound'а: проверяет путь и эхом возвращает полезную нагрузку."""
+
+    def __init__(self, tag: str, transport: str, expected: str, port: int):
+        self.tag = tag
+        self.transport = transport
+        self.expected = expected
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+
+    async def stop(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            start, headers = await read_head(reader)
+            if start.startswith("PRI * HTTP/2.0"):
+                await self._serve_h2(reader, writer, b"PRI * HTTP/2.0\r\n\r\n")
+                return
+            while True:
+                method, path = (start.split() + ["", ""])[:2]
+                if not path.startswith(self.expected):
+                    writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    await writer.drain()
+                    return
+                if self.transport == "ws":
+                    await self._serve_ws(reader, writer, headers)
+                    return
+                if self.transport == "httpupgrade":
+                    await self._serve_raw(reader, writer)
+                    return
+                await self._serve_http(reader, writer, headers)
+                start, headers = await read_head(reader)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_ws(self, reader, writer, headers) -> None:
+        accept = ws_accept(headers.get("sec-websocket-key", ""))
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        while True:
+            opcode, data = await ws_read(reader)
+            if opcode == 0x8:
+                writer.write(ws_frame(data, 0x8))
+                await writer.drain()
+                return
+            writer.write(ws_frame(data, opcode))
+            await writer.drain()
+
+    async def _serve_raw(self, reader, writer) -> None:
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n\r\n")
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            writer.write(data)
+            await writer.drain()
+
+    async def _serve_http(self, reader, writer, headers) -> None:
+        body = await reader.readexactly(int(headers.get("content-length", "0")))
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def _serve_h2(self, reader, writer, prefix: bytes) -> None:
+        if h2 is None:
+            return
+        conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        bodies: Dict[int, bytearray] = {}
+        paths: Dict[int, str] = {}
+        data = prefix
+        while True:
+            if not data:
+                data = await reader.read(65536)
+                if not data:
+                    return
+            for ev in conn.receive_data(data):
+                if isinstance(ev, h2.events.RequestReceived):
+                    paths[ev.stream_id] = dict(ev.headers).get(":path", "")
+                    bodies[ev.stream_id] = bytearray()
+                elif isinstance(ev, h2.events.DataReceived):
+                    bodies.setdefault(ev.stream_id, bytearray()).extend(ev.data)
+                    conn.acknowledge_received_data(ev.flow_controlled_length, ev.stream_id)
+                elif isinstance(ev, h2.events.StreamEnded):
+                    body = bytes(bodies.pop(ev.stream_id, b""))
+                    ok = paths.pop(ev.stream_id, "").startswith(self.expected)
+                    conn.send_headers(ev.stream_id, [(":status", "200" if ok else "404"),
+                                                     ("content-length", str(len(body) if ok else 0))])
+                    conn.send_data(ev.stream_id, body if ok else b"", end_stream=True)
+                elif isinstance(ev, h2.events.ConnectionTerminated):
+                    return
+            data = b""
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+# =========================================================
+# Клиенты
+# =========================================================
+async def _drive_ws(reader, writer, route, n, payload, lat) -> None:
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    writer.write((f"GET {route['path']} HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                  "Sec-WebSocket-Version: 13\r\n\r\n").encode("latin-1"))
+    start, headers = await read_head(reader)
+    if " 101 " not in start or headers.get("sec-websocket-accept") != ws_accept(key):
+        raise ConnectionError(f"handshake failed: {start}")
+    for _ in range(n):
+        t0 = time.perf_counter()
+        writer.write(ws_frame(payload, mask=True))
+        await writer.drain()
+        _, echo = await ws_read(reader)
+        if len(echo) != len(payload):
+            raise ConnectionError("short echo")
+        lat.append(time.perf_counter() - t0)
+    writer.write(ws_frame(b"", 0x8, mask=True))
+    await writer.drain()
+
+async def _drive_upgrade(reader, writer, route, n, payload, lat) -> None:
+    writer.write((f"GET {route['path']} HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                  "Connection: Upgrade\r\n\r\n").encode("latin-1"))
+    start, _ = await read_head(reader)
+    if " 101 " not in start:
+        raise ConnectionError(f"upgrade failed: {start}")
+    for _ in range(n):
+        t0 = time.perf_counter()
+        writer.write(payload)
+        await writer.drain()
+        await reader.readexactly(len(payload))
+        lat.append(time.perf_counter() - t0)
+
+async def _drive_http(reader, writer, route, n, payload, lat) -> None:
+    head = (f"POST {route['path']} HTTP/1.1\r\nHost: localhost\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n").encode("latin-1")
+    for _ in range(n):
+        t0 = time.perf_counter()
+        writer.write(head + payload)
+        await writer.drain()
+        start, headers = await read_head(reader)
+        if " 200 " not in start:
+            raise ConnectionError(start)
+        await reader.readexactly(int(headers.get("content-length", "0")))
+        lat.append(time.perf_counter() - t0)
+
+async def _drive_h2(reader, writer, route, n, payload, lat) -> None:
+    conn = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=True, header_encoding="utf-8"))
+    conn.initiate_connection()
+    ctype = "application/grpc" if route["transport"] == "grpc" else "application/octet-stream"
+    for _ in range(n):
+        sid = conn.get_next_available_stream_id()
+        t0 = time.perf_counter()
+        conn.send_headers(sid, [(":method", "POST"), (":scheme", "http"), (":authority", "localhost"),
+                                (":path", route["path"]), ("content-type", ctype), ("te", "trailers")])
+        conn.send_data(sid, payload, end_stream=True)
+        writer.write(conn.data_to_send())
+        await writer.drain()
+
+        status, done = None, False
+        while not done:
+            data = await reader.read(65536)
+            if not data:
+                raise ConnectionError("connection closed")
+            for ev in conn.receive_data(data):
+                if isinstance(ev, h2.events.ResponseReceived) and ev.stream_id == sid:
+                    status = dict(ev.headers).get(":status")
+                elif isinstance(ev, h2.events.DataReceived):
+                    conn.acknowledge_received_data(ev.flow_controlled_length, ev.stream_id)
+                elif isinstance(ev, h2.events.StreamEnded) and ev.stream_id == sid:
+                    done = True
+                elif isinstance(ev, (h2.events.StreamReset, h2.events.ConnectionTerminated)):
+                    raise ConnectionError(type(ev).__name__)
+            writer.write(conn.data_to_send())
+        if status != "200":
+            raise ConnectionError(f"status {status}")
+        lat.append(time.perf_counter() - t0)
+
+DRIVERS = {"ws": _drive_ws, "httpupgrade": _drive_upgrade, "http": _drive_http}
+
+async def run_route(route: dict, port: int, concurrency: int, messages: int, size: int) -> dict:
+    driver = _drive_h2 if route["proto"] == "h2" else DRIVERS[route["transport"]]
+    if route["proto"] == "h2":
+        size = min(size, H2_MAX_BODY)
+    payload = os.urandom(size)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def worker() -> None:
+        lat: List[float] = []
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            try:
+                await driver(reader, writer, route, messages, payload, lat)
+            finally:
+                writer.close()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            errors.append(str(e) or type(e).__name__)
+        latencies.extend(lat)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p: float) -> Optional[float]:
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+
+    return {
+        "route": route["name"], "tag": route["tag"], "transport": route["transport"],
+        "proto": route["proto"], "path": route["path"], "size": size,
+        "connections": concurrency, "messages": len(latencies), "errors": len(errors),
+        "first_error": errors[0] if errors else None, "elapsed_s": round(elapsed, 3),
+        "msgs_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mb_per_s": round(len(latencies) * size / elapsed / 1e6, 3) if elapsed else 0.0,
+        "p50_ms": pct(0.50), "p99_ms": pct(0.99),
+    }
+
+# =========================================================
+# HAProxy
+# =========================================================
+async def _wait_port(port: int, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, w = await asyncio.open_connection("127.0.0.1", port)
+            w.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+def start_haproxy(binary: str, cfg_path: str) -> subprocess.Popen:
+    rc = subprocess.call([binary, "-c", "-f", cfg_path])
+    if rc != 0:
+        raise RuntimeError(f"harness config rejected by {binary} (rc={rc}): {cfg_path}")
+    return subprocess.Popen([binary, "-f", cfg_path, "-db"])
+
+# =========================================================
+# Основная логика
+# =========================================================
+async def run(args) -> List[dict]:
+    routes = discover_routes(args.server, args.haproxy, args.changes)
+    if args.only:
+        routes = [r for r in routes if args.only in r["name"] or args.only in r["tag"]]
+    if h2 is None and any(r["proto"] == "h2" or r["backend"].endswith("-http") for r in routes):
+        # *-http backend'ы ходят в sing-box по h2 — заглушке тоже нужен python3-h2
+        print("[warn] python3-h2 not installed — skipping h2/gRPC routes")
+        routes = [r for r in routes if r["proto"] != "h2" and not r["backend"].endswith("-http")]
+    if not routes:
+        raise RuntimeError("no routes discovered")
+
+    backends = {}
+    for r in routes:
+        backends.setdefault(r["port"], EchoBackend(r["tag"], r["transport"], r["expected"],
+                                                   r["port"] + args.port_offset))
+    for b in backends.values():
+        await b.start()
+    print(f"[info] {len(backends)} echo backend(s), {len(routes)} route(s)")
+
+    proc, workdir = None, tempfile.mkdtemp(prefix="vpn-loadtest-")
+    try:
+        if not args.direct:
+            cfg_path = os.path.join(workdir, "haproxy.cfg")
+            with open(cfg_path, "w", encoding="utf-8") as f:
+                f.write(build_harness_cfg(args.haproxy, routes, args.tcp_port, args.h2_port, args.port_offset))
+            print(f"[run ] {args.haproxy_bin} -f {cfg_path}")
+            proc = start_haproxy(args.haproxy_bin, cfg_path)
+            await _wait_port(args.tcp_port)
+            await _wait_port(args.h2_port)
+
+        results = []
+        for r in routes:
+            if args.direct:
+                port = r["port"] + args.port_offset
+            else:
+                port = args.h2_port if r["proto"] == "h2" else args.tcp_port
+            results.append(await run_route(r, port, args.concurrency, args.messages, args.size))
+        return results
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+        for b in backends.values():
+            await b.stop()
+        if args.keep_cfg:
+            print(f"[info] harness files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def print_report(results: List[dict]) -> None:
+    print(f"{'route':44} {'proto':5} {'tr':11} {'msgs':>7} {'err':>4} {'msg/s':>9} {'MB/s':>8} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        p50 = "-" if r["p50_ms"] is None else f"{r['p50_ms']:.3f}"
+        p99 = "-" if r["p99_ms"] is None else f"{r['p99_ms']:.3f}"
+        print(f"{r['route']:44} {r['proto']:5} {r['transport']:11} {r['messages']:7d} {r['errors']:4d} "
+              f"{r['msgs_per_s']:9.1f} {r['mb_per_s']:8.3f} {p50:>8} {p99:>8}")
+        if r["first_error"]:
+            print(f"    [err ] {r['first_error']}")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Load-test HAProxy -> sing-box routing paths with local echo backends")
+    p.add_argument("--server", default=SERVER_PATH, help="path to server.json")
+    p.add_argument("--haproxy", default=HAP_PATH, help="path to haproxy.cfg (routes source)")
+    p.add_argument("--changes", default=CHANGES_PATH, help="path to changes_dict.json")
+    p.add_argument("--haproxy-bin", default=HAP_BIN, help="haproxy binary, $HAP_BIN as in 08/12 (default %(default)s)")
+    p.add_argument("--concurrency", type=int, default=16, help="connections per route")
+    p.add_argument("--messages", type=int, default=200, help="round trips per connection")
+    p.add_argument("--size", type=int, default=4096, help=f"payload bytes (h2 capped at {H2_MAX_BODY})")
+    p.add_argument("--tcp-port", type=int, default=18080, help="harness in-tcpmode port")
+    p.add_argument("--h2-port", type=int, default=18081, help="harness in-httpmode (h2c) port")
+    p.add_argument("--port-offset", type=int, default=0,
+                   help="shift echo backend ports (when real inbounds are running)")
+    p.add_argument("--only", help="run only routes whose name or tag contains this")
+    p.add_argument("--direct", action="store_true", help="bypass haproxy (baseline against echo backends)")
+    p.add_argument("--json", help="also write results as JSON to this path")
+    p.add_argument("--keep-cfg", action="store_true", help="keep the generated harness haproxy.cfg")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    try:
+        results = asyncio.run(run(args))
+    except (OSError, RuntimeError) as e:
+        print(f"[err ] {e}", file=sys.stderr)
+        sys.exit(2)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if any(r["errors"] for r in results) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метрики пайплайна bootstrap/reload в формате Prometheus.
+
+Каждый шаг (copy_files.py, 10_*, 11_*, reload-скрипты) пишет свой файл
+<job>.prom в METRICS_DIR — его можно скормить node-exporter textfile collector.
+Счётчики накапливаются между запусками через <job>.json рядом.
+
+CLI (для bash-скриптов):
+    metrics.py reload <service> <ok|fail> <seconds>
+    metrics.py serve [--listen 127.0.0.1:9105]
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, Optional
+
+# =========================================================
+# Контейнерные пути / ENV
+# =========================================================
+APP_ROOT = os.getenv("APP_ROOT", "/app")
+APP_DATA = os.getenv("APP_DATA", os.path.join(APP_ROOT, "data"))
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(APP_DATA, "metrics"))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1:9105")
+
+PREFIX = "vpn_stack"
+ROTATION_JOB = "mutate_server_json"
+ROTATION_METRIC = f"{PREFIX}_rotation_last_timestamp_seconds"
+
+NOTE_KINDS = ("PATH", "MISS", "HOST", "WARN", "BACKUP", "WRITE", "GEN", "SKIP")
+_NOTE_RX = re.compile(r"^\[([A-Z]+)\]")
+
+# =========================================================
+# Хранилище метрик одного шага
+# =========================================================
+class JobMetrics:
+    """
+    Метрики одного job'а. Gauge перезаписываются, counter накапливаются
+    (состояние мёржится с <job>.json под flock в flush()).
+    Серии, которые пишут несколько job'ов (bytes_written, rewrite_notes),
+    несут label job — иначе textfile collector отвергнет дубли между файлами.
+    Ошибки записи метрик никогда не ломают основной шаг.
+    """
+
+    def __init__(self, job: str, directory: Optional[str] = None):
+        self.job = job
+        self.directory = directory or METRICS_DIR
+        self.state_path = os.path.join(self.directory, f"{job}.json")
+        self.prom_path = os.path.join(self.directory, f"{job}.prom")
+        self.lock_path = os.path.join(self.directory, f".{job}.lock")
+        self._metrics: Dict[str, dict] = {}
+        self._pending_inc: Dict[str, Dict[str, float]] = {}
+
+    # ---- регистрация значений ------------------------------------------------
+    def _series(self, name: str, kind: str, help_text: str) -> dict:
+        m = self._metrics.setdefault(name, {"type": kind, "help": help_text, "samples": {}})
+        m["type"], m["help"] = kind, help_text
+        return m
+
+    def set(self, name: str, value: float, help_text: str = "", **labels: str) -> None:
+        key = _labels_key(labels)
+        self._series(name, "gauge", help_text)["samples"][key] = float(value)
+
+    def inc(self, name: str, amount: float = 1.0, help_text: str = "", **labels: str) -> None:
+        key = _labels_key(labels)
+        self._series(name, "counter", help_text)
+        bucket = self._pending_inc.setdefault(name, {})
+        bucket[key] = bucket.get(key, 0.0) + float(amount)
+
+    @contextmanager
+    def step(self, step: str) -> Iterator[None]:
+        """Время выполнения шага + флаг успеха (последний запуск)."""
+        started = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record_step(step, time.monotonic() - started, ok)
+
+    def record_step(self, step: str, seconds: float, ok: bool) -> None:
+        self.set(f"{PREFIX}_step_duration_seconds", seconds,
+                 "Duration of the last run of a pipeline step", step=step)
+        self.set(f"{PREFIX}_step_success", 1 if ok else 0,
+                 "Whether the last run of a pipeline step succeeded", step=step)
+        self.set(f"{PREFIX}_step_last_run_timestamp_seconds", time.time(),
+                 "Unix time of the last run of a pipeline step", step=step)
+        self.inc(f"{PREFIX}_step_runs_total", 1,
+                 "Pipeline step runs", step=step, result="ok" if ok else "fail")
+
+    def bytes_written(self, amount: int, target: str) -> None:
+        self.inc(f"{PREFIX}_bytes_written_total", amount,
+                 "Bytes written by pipeline steps", job=self.job, target=target)
+
+    def count_notes(self, notes: Iterable[str]) -> None:
+        """Считает [PATH]/[MISS]/[HOST]/... заметки apply_haproxy_changes."""
+        counts: Dict[str, int] = {k: 0 for k in NOTE_KINDS}
+        for note in notes:
+            m = _NOTE_RX.match(note)
+            if m:
+                counts[m.group(1)] = counts.get(m.group(1), 0) + 1
+        for kind, n in counts.items():
+            self.set(f"{PREFIX}_rewrite_notes", n,
+                     "Rewrite notes of the last haproxy.cfg rewrite by kind", job=self.job, kind=kind.lower())
+            self.inc(f"{PREFIX}_rewrite_notes_total", n,
+                     "Rewrite notes of haproxy.cfg rewrites by kind", job=self.job, kind=kind.lower())
+
+    # ---- запись ---------------------------------------------------------------
+    def flush(self) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.lock_path, "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                state = _load_state(self.state_path)
+                for name, m in self._metrics.items():
+                    cur = state.setdefault(name, {"type": m["type"], "help": m["help"], "samples": {}})
+                    cur["type"], cur["help"] = m["type"], m["help"]
+                    # Сэмплы со старым набором label'ов больше не пишутся — убираем
+                    layouts = {_label_names(k) for k in m["samples"]}
+                    layouts |= {_label_names(k) for k in self._pending_inc.get(name, {})}
+                    cur["samples"] = {k: v for k, v in cur["samples"].items() if _label_names(k) in layouts}
+                    cur["samples"].update(m["samples"])
+                    for key, amount in self._pending_inc.get(name, {}).items():
+                        cur["samples"][key] = cur["samples"].get(key, 0.0) + amount
+                _atomic_write(self.state_path, json.dumps(state, ensure_ascii=False, indent=2))
+                _atomic_write(self.prom_path, render(state))
+            self._metrics.clear()
+            self._pending_inc.clear()
+        except Exception as e:
+            print(f"[warn] metrics flush failed for {self.job}: {e}", file=sys.stderr)
+
+# =========================================================
+# Вспомогательные функции
+# =========================================================
+def _labels_key(labels: Dict[str, str]) -> str:
+    return json.dumps(sorted((k, str(v)) for k, v in labels.items()), ensure_ascii=False)
+
+def _label_names(key: str) -> tuple:
+    return tuple(k for k, _ in json.loads(key)) if key else ()
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(key: str) -> str:
+    pairs = json.loads(key) if key else []
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _load_state(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _atomic_write(path: str, text: str) -> None:
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def render(state: dict) -> str:
+    lines = []
+    for name in sorted(state):
+        m = state[name]
+        if m.get("help"):
+            lines.append(f"# HELP {name} {m['help']}")
+        lines.append(f"# TYPE {name} {m['type']}")
+        for key in sorted(m["samples"]):
+            lines.append(f"{name}{_format_labels(key)} {float(m['samples'][key])!r}")
+    return "\n".join(lines) + "\n"
+
+def record_reload(service: str, ok: bool, seconds: float, directory: Optional[str] = None) -> None:
+    jm = JobMetrics(f"reload_{service}", directory)
+    result = "ok" if ok else "fail"
+    jm.inc(f"{PREFIX}_reloads_total", 1, "Proxy reloads", service=service, result=result)
+    jm.inc(f"{PREFIX}_reload_seconds_total", seconds,
+           "Total time spent in proxy reloads", service=service)
+    jm.set(f"{PREFIX}_reload_last_duration_seconds", seconds,
+           "Duration of the last proxy reload", service=service)
+    jm.set(f"{PREFIX}_reload_last_timestamp_seconds", time.time(),
+           "Unix time of the last proxy reload", service=service)
+    jm.flush()
+
+def collect(directory: Optional[str] = None) -> str:
+    """
+    Сводит состояния всех job'ов в один ответ (семейства метрик из разных
+    файлов объединяются) + возраст последней ротации, посчитанный на лету.
+    """
+    directory = directory or METRICS_DIR
+    merged: dict = {}
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.endswith(".json"))
+    except OSError:
+        names = []
+    for name in names:
+        for metric, m in _load_state(os.path.join(directory, name)).items():
+            cur = merged.setdefault(metric, {"type": m["type"], "help": m.get("help", ""), "samples": {}})
+            cur["samples"].update(m.get("samples", {}))
+
+    samples = merged.get(ROTATION_METRIC, {}).get("samples", {})
+    if samples:
+        merged[f"{PREFIX}_rotation_age_seconds"] = {
+            "type": "gauge",
+            "help": "Seconds since the last secrets/paths rotation",
+            "samples": {_labels_key({}): time.time() - max(samples.values())},
+        }
+    return render(merged) if merged else ""
+
+# =========================================================
+# HTTP endpoint
+# =========================================================
+class _Handler(BaseHTTPRequestHandler):
+    directory = METRICS_DIR
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = collect(self.directory).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+def serve(listen: str, directory: str) -> None:
+    host, _, port = listen.rpartition(":")
+    _Handler.directory = directory
+    httpd = ThreadingHTTPServer((host or "127.0.0.1", int(port)), _Handler)
+    print(f"[info] serving metrics from {directory} on http://{listen}/metrics")
+    httpd.serve_forever()
+
+# =========================================================
+# Точка входа
+# =========================================================
+def parse_args():
+    p = argparse.ArgumentParser(description="vpn_stack Prometheus metrics helper")
+    p.add_argument("--dir", default=METRICS_DIR, help="metrics directory (textfile collector)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("reload", help="record a proxy reload")
+    r.add_argument("service")
+    r.add_argument("result", choices=["ok", "fail"])
+    r.add_argument("seconds", type=float)
+
+    s = sub.add_parser("serve", help="expose metrics over HTTP")
+    s.add_argument("--listen", default=METRICS_LISTEN, help="host:port (default %(default)s)")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "reload":
+        record_reload(args.service, args.result == "ok", args.seconds, args.dir)
+    elif args.cmd == "serve":
+        serve(args.listen, args.dir)
+
+if __name__ == "__main__":
+    main()
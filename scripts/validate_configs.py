@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка server.json (sing-box) и haproxy.cfg без запуска бинарников.
+
+Сверяет теги, listen_port, path_beg/service_name и SNI между конфигами,
+ищет дублирующиеся порты и висячие backend'ы. Внешние проверки
+(`sing-box check -c`, `haproxy -c -f`) кэшируются по sha256 содержимого
+конфига и size/mtime файлов, на которые он ссылается (сертификаты, map'ы,
+списки ACL): неизменённый набор повторно не проверяется.
+
+CLI:
+    validate_configs.py cross [--server PATH] [--haproxy PATH] [--strict]
+    validate_configs.py check singbox|haproxy [--config PATH] [--bin BIN]
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from haproxy_changes import TAG_TO_BACKENDS
+from metrics import PREFIX, JobMetrics
+
+# =========================================================
+# Контейнерные пути / ENV
+# =========================================================
+APP_ROOT = os.getenv("APP_ROOT", "/app")
+APP_CFG  = os.getenv("APP_CFG",  os.path.join(APP_ROOT, "config"))
+APP_DATA = os.getenv("APP_DATA", os.path.join(APP_ROOT, "data"))
+
+SERVER_PATH = os.getenv("SINGBOX_CONFIG", os.path.join(APP_CFG, "server.json"))
+HAP_PATH    = os.getenv("HAP_CFG", os.getenv("HAP_PATH", os.path.join(APP_CFG, "haproxy", "haproxy.cfg")))
+CACHE_PATH  = os.getenv("VALIDATE_CACHE", os.path.join(APP_DATA, "validate_cache.json"))
+CACHE_MAX   = int(os.getenv("VALIDATE_CACHE_MAX", "64"))
+
+SINGBOX_BIN = os.getenv("SINGBOX_BIN", "sing-box")
+HAP_BIN     = os.getenv("HAP_BIN", "haproxy")
+
+# Протоколы sing-box, слушающие UDP (остальные — TCP; shadowsocks — оба)
+UDP_INBOUNDS = {"hysteria", "hysteria2", "tuic"}
+BOTH_INBOUNDS = {"shadowsocks"}
+
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "0.0.0.0", "::1"}
+
+# Backend -> тег inbound'а, чей SNI должен совпадать с req.ssl_sni / hdr(host)
+SNI_BACKENDS: Dict[str, str] = {
+    "sp_special_reality_tcp_43124": "realityin_43124",
+    "sp_special_reality_tcp_http_43124": "realityin_43124",
+    "shadowtls": "shadowtls",
+    "shadowtls_decoy_http": "shadowtls",
+}
+
+# =========================================================
+# Разбор конфигов
+# =========================================================
+_SECTION_RX = re.compile(r"^(global|defaults|frontend|backend|listen)\b\s*(\S+)?")
+_USE_BACKEND_RX = re.compile(
+    r"^use_backend\s+(\S+)\s+if\s+\{\s*(path_beg|path|req\.ssl_sni|hdr\(host\))\s+(?:-i\s+)?([^\s}]+)"
+)
+_SERVER_RX = re.compile(r"^server\s+(\S+)\s+(\S+)")
+_HOSTPORT_RX = re.compile(r"^(?:(\S*):)?(\d+)$")
+# Файлы, которые читает `haproxy -c`: crt/ca-file/..., map_*(...), ACL -f
+_HAP_FILE_RX = re.compile(
+    r"(?:\b(?:crt|crt-list|ca-file|crl-file|lua-load|errorfile\s+\d+)\s+|\bmap(?:_\w+)?\(|\s-f\s+)(/[^\s,)]+)"
+)
+
+def load_server(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("top-level JSON is not an object")
+
+    inbounds = {}
+    for ib in data.get("inbounds", []):
+        tag = ib.get("tag", "")
+        transport = ib.get("transport") or {}
+        tls = ib.get("tls") or {}
+        reality = tls.get("reality") or {}
+        handshake = ib.get("handshake") or reality.get("handshake") or {}
+
+        path = transport.get("path")
+        if not path and transport.get("service_name"):
+            path = f"/{transport['service_name']}"
+
+        inbounds[tag] = {
+            "type": ib.get("type", ""),
+            "listen": ib.get("listen", ""),
+            "port": ib.get("listen_port"),
+            "transport": transport.get("type", ""),
+            "path": path,
+            "sni": tls.get("server_name") or handshake.get("server"),
+        }
+    return inbounds
+
+def load_haproxy(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    backends: Dict[str, List[Tuple[str, Optional[int]]]] = {}
+    rules: List[dict] = []
+    binds: List[Tuple[str, int]] = []
+    section = name = None
+
+    for raw in lines:
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+
+        m = _SECTION_RX.match(line)
+        if m:
+            section, name = m.group(1), m.group(2)
+            if section == "backend":
+                backends.setdefault(name, [])
+            continue
+
+        if section == "backend":
+            sm = _SERVER_RX.match(line)
+            if sm:
+                hp = _HOSTPORT_RX.match(sm.group(2))
+                backends[name].append((hp.group(1) or "", int(hp.group(2))) if hp else (sm.group(2), None))
+            continue
+
+        if section not in ("frontend", "listen"):
+            continue
+
+        if line.startswith("bind "):
+            for addr in line.split()[1].split(","):
+                proto = "udp" if addr.startswith("quic") else "tcp"
+                hp = _HOSTPORT_RX.match(addr.split("@", 1)[-1])
+                if hp and not addr.startswith(("abns@", "unix@")):
+                    binds.append((proto, int(hp.group(2))))
+            continue
+
+        um = _USE_BACKEND_RX.match(line)
+        if um:
+            rules.append({"frontend": name, "backend": um.group(1), "kind": um.group(2), "value": um.group(3)})
+        elif line.startswith("use_backend ") or line.startswith("default_backend "):
+            target = line.split()[1]
+            if "%[" not in target:
+                rules.append({"frontend": name, "backend": target, "kind": "default", "value": None})
+
+    return {"backends": backends, "rules": rules, "binds": binds}
+
+# =========================================================
+# Проверки
+# =========================================================
+def inbound_protos(ib_type: str) -> List[str]:
+    if ib_type in BOTH_INBOUNDS:
+        return ["tcp", "udp"]
+    return ["udp"] if ib_type in UDP_INBOUNDS else ["tcp"]
+
+def check_server(inbounds: dict) -> List[Tuple[str, str, str]]:
+    """Проверки одного server.json. Результат: (level, scope, message)."""
+    issues = []
+    seen: Dict[Tuple[str, int], str] = {}
+    for tag, ib in inbounds.items():
+        if not tag:
+            issues.append(("ERR", "server", "inbound без tag"))
+        if ib["port"] is None:
+            issues.append(("ERR", "server", f"{tag}: нет listen_port"))
+            continue
+        for proto in inbound_protos(ib["type"]):
+            key = (proto, ib["port"])
+            if key in seen:
+                issues.append(("ERR", "server", f"порт {proto}/{ib['port']} занят и {seen[key]}, и {tag}"))
+            else:
+                seen[key] = tag
+    return issues
+
+def check_haproxy(hap: dict) -> List[Tuple[str, str, str]]:
+    """Проверки одного haproxy.cfg."""
+    issues = []
+    for r in hap["rules"]:
+        if r["backend"] not in hap["backends"]:
+            issues.append(("ERR", "haproxy", f"{r['frontend']}: use_backend {r['backend']} — backend не объявлен"))
+    for be, servers in hap["backends"].items():
+        if not servers and be not in ("generate_204",):
+            if not any(r["backend"] == be for r in hap["rules"]):
+                issues.append(("WARN", "haproxy", f"backend {be} без server и без ссылок"))
+    return issues
+
+def check_cross(inbounds: dict, hap: dict) -> List[Tuple[str, str, str]]:
+    """Сверка server.json <-> haproxy.cfg."""
+    issues = []
+    ports = {ib["port"]: tag for tag, ib in inbounds.items() if ib["port"] is not None}
+
+    # Теги -> backend'ы: порты и path_beg
+    for tag, backends in TAG_TO_BACKENDS.items():
+        ib = inbounds.get(tag)
+        for be in backends:
+            if be not in hap["backends"]:
+                if ib:
+                    issues.append(("WARN", "cross", f"{tag}: backend {be} отсутствует в haproxy.cfg"))
+                continue
+            for host, port in hap["backends"][be]:
+                if ib is None:
+                    issues.append(("WARN", "cross", f"backend {be} -> {host}:{port}: inbound {tag} не найден в server.json"))
+                elif port != ib["port"]:
+                    issues.append(("ERR", "cross", f"backend {be} -> порт {port}, а {tag} слушает {ib['port']}"))
+
+        if ib is None or not ib["path"]:
+            continue
+        paths = sorted({r["value"] for r in hap["rules"] if r["backend"] in backends and r["kind"] == "path_beg"})
+        if not paths:
+            issues.append(("WARN", "cross", f"{tag}: нет use_backend с path_beg"))
+        for p in paths:
+            if p != ib["path"]:
+                issues.append(("ERR", "cross", f"{tag}: path_beg {p} != {ib['path']} из server.json"))
+
+    # Висячие backend'ы: локальный порт без inbound'а
+    mapped = {be for bes in TAG_TO_BACKENDS.values() for be in bes}
+    for be, servers in hap["backends"].items():
+        if be in mapped:
+            continue
+        for host, port in servers:
+            if port is not None and host in LOCAL_HOSTS and port not in ports and port >= 1024:
+                issues.append(("WARN", "cross", f"backend {be} -> {host}:{port}: нет inbound'а на этом порту"))
+
+    # SNI
+    for r in hap["rules"]:
+        tag = SNI_BACKENDS.get(r["backend"])
+        if r["kind"] not in ("req.ssl_sni", "hdr(host)") or not tag or tag not in inbounds:
+            continue
+        sni = inbounds[tag]["sni"]
+        if sni and r["value"].lower() != sni.lower():
+            issues.append(("WARN", "cross", f"{r['backend']}: SNI {r['value']} != {sni} ({tag})"))
+
+    # Порты inbound'ов против bind'ов haproxy
+    for tag, ib in inbounds.items():
+        if ib["listen"] in ("127.0.0.1", "localhost"):
+            continue
+        for proto in inbound_protos(ib["type"]):
+            if (proto, ib["port"]) in hap["binds"]:
+                issues.append(("ERR", "cross", f"{tag}: {proto}/{ib['port']} уже слушает haproxy"))
+    return issues
+
+def _load(loader, path: str, scope: str, issues: List[Tuple[str, str, str]]) -> Optional[dict]:
+    """Ошибка чтения/разбора — ERR в своём scope, а не traceback."""
+    try:
+        return loader(path)
+    except (OSError, ValueError) as e:
+        issues.append(("ERR", scope, f"{path}: не удалось разобрать ({type(e).__name__}: {e})"))
+        return None
+
+def validate(server_path: Optional[str], haproxy_path: Optional[str]) -> List[Tuple[str, str, str]]:
+    """
+    Нечитаемый конфиг даёт ERR только в своём scope (server / haproxy):
+    битый server.json не блокирует проверку haproxy и наоборот.
+    Сверка cross выполняется, лишь когда разобраны оба конфига.
+    """
+    issues = []
+    inbounds = hap = None
+    if server_path and os.path.exists(server_path):
+        inbounds = _load(load_server, server_path, "server", issues)
+        if inbounds is not None:
+            issues += check_server(inbounds)
+    if haproxy_path and os.path.exists(haproxy_path):
+        hap = _load(load_haproxy, haproxy_path, "haproxy", issues)
+        if hap is not None:
+            issues += check_haproxy(hap)
+    if inbounds is not None and hap is not None:
+        issues += check_cross(inbounds, hap)
+    return issues
+
+# =========================================================
+# Кэш внешних проверок
+# =========================================================
+def referenced_files(config_path: str) -> List[str]:
+    """
+    Файлы, которые внешняя проверка читает помимо самого конфига:
+    *_path из server.json (certificate_path, key_path, ...), crt/map/-f
+    из haproxy.cfg. Каталоги (crt /opt/ssl/) раскрываются на один уровень.
+    """
+    paths = set()
+    if config_path.endswith(".json"):
+        with open(config_path, "r", encoding="utf-8") as f:
+            stack = [json.load(f)]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                for k, v in node.items():
+                    if k.endswith("_path") and isinstance(v, str) and v.startswith("/"):
+                        paths.add(v)
+                    else:
+                        stack.append(v)
+            elif isinstance(node, list):
+                stack.extend(node)
+    else:
+        with open(config_path, "r", encoding="utf-8") as f:
+            for raw in f:
+                paths.update(_HAP_FILE_RX.findall(raw.split("#", 1)[0]))
+
+    files = set()
+    for p in paths:
+        if os.path.isdir(p):
+            files.update(os.path.join(p, n) for n in os.listdir(p))
+        else:
+            files.add(p)
+    return sorted(files)
+
+def _cache_key(cmd: List[str], config_path: str) -> str:
+    h = hashlib.sha256()
+    h.update("\0".join(cmd).encode("utf-8"))
+    binary = shutil.which(cmd[0]) or cmd[0]
+    try:
+        st = os.stat(binary)
+        h.update(f"\0{binary}\0{st.st_size}\0{st.st_mtime_ns}".encode("utf-8"))
+    except OSError:
+        pass
+    with open(config_path, "rb") as f:
+        h.update(f.read())
+    # Обновлённый сертификат/map при тех же байтах конфига — новая проверка
+    for path in referenced_files(config_path):
+        try:
+            st = os.stat(path)
+            h.update(f"\0{path}\0{st.st_size}\0{st.st_mtime_ns}".encode("utf-8"))
+        except OSError:
+            h.update(f"\0{path}\0missing".encode("utf-8"))
+    return h.hexdigest()
+
+def external_check(cmd: List[str], config_path: str, cache_path: str = CACHE_PATH) -> Tuple[int, bool]:
+    """
+    Запускает cmd, если для содержимого config_path нет успешного результата
+    в кэше. Кэшируются только успехи. Возвращает (rc, cache_hit).
+    """
+    key = _cache_key(cmd, config_path)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+        if key in cache:
+            return 0, True
+
+        rc = subprocess.call(cmd)
+        if rc == 0:
+            cache[key] = {"cmd": " ".join(cmd), "ts": time.time()}
+            for old in sorted(cache, key=lambda k: cache[k]["ts"])[:-CACHE_MAX]:
+                del cache[old]
+            tmp = f"{cache_path}.tmp.{os.getpid()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, cache_path)
+        return rc, False
+
+# =========================================================
+# Точка входа
+# =========================================================
+def _print_issues(issues: List[Tuple[str, str, str]]) -> None:
+    for level, scope, msg in issues:
+        print(f"[{level}] ({scope}) {msg}")
+
+def run_check(target: str, config: str, binary: str) -> int:
+    if target == "singbox":
+        cmd, blocking = [binary, "check", "-c", config], ("server",)
+        issues = validate(config, HAP_PATH)
+    else:
+        cmd, blocking = [binary, "-c", "-f", config], ("haproxy", "cross")
+        issues = validate(SERVER_PATH, config)
+
+    _print_issues(issues)
+    errors = [i for i in issues if i[0] == "ERR" and i[1] in blocking]
+    if errors:
+        print(f"[err ] {len(errors)} blocking issue(s) in {config}", file=sys.stderr)
+        return 2
+
+    metrics = JobMetrics(f"check_{target}")
+    started = time.monotonic()
+    rc, hit = external_check(cmd, config)
+    metrics.inc(f"{PREFIX}_config_checks_total", 1, "External config checks by cache outcome",
+                target=target, cache="hit" if hit else "miss", result="ok" if rc == 0 else "fail")
+    metrics.set(f"{PREFIX}_config_check_last_duration_seconds", time.monotonic() - started,
+                "Duration of the last config check (including cache lookup)", target=target)
+    metrics.flush()
+    if hit:
+        print(f"[ok  ] {config}: unchanged since last successful check (cached)")
+    return rc
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Cross-validate server.json and haproxy.cfg")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    c = sub.add_parser("cross", help="in-process cross-check only")
+    c.add_argument("--server", default=SERVER_PATH, help="path to server.json")
+    c.add_argument("--haproxy", default=HAP_PATH, help="path to haproxy.cfg")
+    c.add_argument("--strict", action="store_true", help="treat warnings as errors")
+
+    k = sub.add_parser("check", help="cross-check + cached external check")
+    k.add_argument("target", choices=["singbox", "haproxy"])
+    k.add_argument("--config", help="config path (default from ENV)")
+    k.add_argument("--bin", help="binary (default from ENV)")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "cross":
+        issues = validate(args.server, args.haproxy)
+        _print_issues(issues)
+        levels = ("ERR", "WARN") if args.strict else ("ERR",)
+        sys.exit(1 if any(i[0] in levels for i in issues) else 0)
+
+    if args.target == "singbox":
+        config, binary = args.config or SERVER_PATH, args.bin or SINGBOX_BIN
+    else:
+        config, binary = args.config or HAP_PATH, args.bin or HAP_BIN
+    try:
+        sys.exit(run_check(args.target, config, binary))
+    except (OSError, ValueError) as e:
+        print(f"[err ] check {args.target}: {e}", file=sys.stderr)
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()